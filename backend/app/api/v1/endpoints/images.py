@@ -4,6 +4,7 @@ from fastapi.responses import JSONResponse
 from typing import List, Optional
 import structlog
 
+from app.dependencies import get_image_service
 from app.services.image_service import ImageService
 from app.schemas.image import ImageUploadResponse, ImageInfo, ImageListResponse
 from app.config import settings
@@ -11,9 +12,6 @@ from app.config import settings
 logger = structlog.get_logger()
 router = APIRouter()
 
-def get_image_service() -> ImageService:
-    return ImageService()
-
 @router.post("/upload", response_model=ImageUploadResponse)
 async def upload_image(
     file: UploadFile = File(...),
@@ -63,20 +61,18 @@ async def get_image_info(
     image_id: str,
     image_service: ImageService = Depends(get_image_service)
 ):
-    """Get information about an uploaded image."""
+    """Get information about an uploaded image (from the image index; pixels are not read)."""
     
-    image_url = await image_service.get_image_url(image_id)
-    if not image_url:
+    record = await image_service.get_image_record(image_id)
+    if record is None:
         raise HTTPException(status_code=404, detail="Image not found")
     
-    # Load image to get dimensions
-    image_data = await image_service.get_image_data(image_id)
-    if image_data is None:
-        raise HTTPException(status_code=404, detail="Image data not found")
-    
     return {
         "id": image_id,
-        "url": image_url,
-        "dimensions": image_data.shape[:2],
-        "channels": image_data.shape[2] if len(image_data.shape) > 2 else 1
+        "url": record.url,
+        "dimensions": (record.height, record.width),
+        "channels": 3,  # uploads are always served as RGB
+        "format": record.format,
+        "size": record.size,
+        "content_hash": record.content_hash or None
     }
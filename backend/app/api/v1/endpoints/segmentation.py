@@ -1,13 +1,13 @@
 # app/api/v1/endpoints/segmentation.py
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
 from fastapi.responses import JSONResponse
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import asyncio
 import structlog
 
-from app.services.segmentation_service import SegmentationService
+from app.dependencies import get_image_service, get_segmentation_service
 from app.services.image_service import ImageService
-from app.services.cache_service import CacheService
+from app.services.segmentation_service import SegmentationService
 from app.schemas.segmentation import (
     SegmentationRequest, SegmentationResponse, AlgorithmInfo, 
     AlgorithmsListResponse, AlgorithmConfig
@@ -17,19 +17,6 @@ from app.config import AVAILABLE_ALGORITHMS
 logger = structlog.get_logger()
 router = APIRouter()
 
-def get_cache_service() -> CacheService:
-    cache_service = CacheService()
-    return cache_service
-
-def get_image_service() -> ImageService:
-    return ImageService()
-
-def get_segmentation_service(
-    cache_service: CacheService = Depends(get_cache_service),
-    image_service: ImageService = Depends(get_image_service)
-) -> SegmentationService:
-    return SegmentationService(cache_service, image_service)
-
 @router.get("/algorithms", response_model=AlgorithmsListResponse)
 async def get_available_algorithms(
     segmentation_service: SegmentationService = Depends(get_segmentation_service)
@@ -51,14 +38,16 @@ async def get_available_algorithms(
                 "type": param_ranges.get("type", "float"),
                 "min_value": param_ranges.get("min"),
                 "max_value": param_ranges.get("max"),
-                "step": param_ranges.get("step")
+                "step": param_ranges.get("step"),
+                "options": param_ranges.get("options")
             }
         
-        # Create a copy of parameter_ranges and remove the problematic 'type' key
+        # Create a copy of parameter_ranges and remove the non-numeric 'type' and 'options' keys
         cleaned_parameter_ranges = {}
         for param_name, ranges in info["parameter_ranges"].items():
             cleaned_ranges = ranges.copy()
             cleaned_ranges.pop("type", None)
+            cleaned_ranges.pop("options", None)
             cleaned_parameter_ranges[param_name] = cleaned_ranges
         
         algorithm_info = AlgorithmInfo(
@@ -282,6 +271,87 @@ async def get_result_by_id(
         raise HTTPException(status_code=500, detail="Internal server error")
     
 
+@router.get("/results/{result_id}/segments")
+async def get_result_segments(
+    result_id: str,
+    image_id: Optional[str] = None,
+    segmentation_service: SegmentationService = Depends(get_segmentation_service)
+):
+    """Per-segment statistics of a result, computed from its stored label map."""
+    
+    try:
+        segments = await segmentation_service.get_result_segments(result_id, image_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Failed to get result segments", result_id=result_id, error=str(e))
+        raise HTTPException(status_code=500, detail="Internal server error")
+    
+    if segments is None:
+        raise HTTPException(status_code=404, detail="Result labels not found")
+    return segments
+
+@router.get("/results/{result_id}/render")
+async def render_result(
+    result_id: str,
+    color_scheme: str = "default",
+    image_format: Optional[str] = None,
+    segmentation_service: SegmentationService = Depends(get_segmentation_service)
+):
+    """Re-render a result from its stored label map, e.g. with another color scheme.
+    
+    ``image_format`` is one of app.utils.encoding.RESULT_FORMATS ("labels" returns raw labels).
+    """
+    
+    try:
+        rendered = await segmentation_service.render_stored_result(result_id, color_scheme, image_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Failed to render result", result_id=result_id, error=str(e))
+        raise HTTPException(status_code=500, detail="Internal server error")
+    
+    if rendered is None:
+        raise HTTPException(status_code=404, detail="Result labels not found")
+    result_image_url, encoded = rendered
+    return {
+        "result_id": result_id,
+        "color_scheme": color_scheme,
+        "result_image_url": result_image_url,
+        "image_format": encoded.format,
+        "encode_time": encoded.encode_time,
+        "encoded_bytes": encoded.nbytes
+    }
+
+@router.delete("/cache/images/{image_id}")
+async def invalidate_image_results(
+    image_id: str,
+    legacy: bool = False,
+    segmentation_service: SegmentationService = Depends(get_segmentation_service)
+):
+    """Drop cached results for an image (``legacy`` also scans for keys written before tagging)."""
+    
+    try:
+        deleted = await segmentation_service.invalidate_image(image_id, legacy=legacy)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"image_id": image_id, "deleted": deleted}
+
+@router.delete("/cache/algorithms/{algorithm_name}")
+async def invalidate_algorithm_results(
+    algorithm_name: str,
+    version: Optional[str] = None,
+    legacy: bool = False,
+    segmentation_service: SegmentationService = Depends(get_segmentation_service)
+):
+    """Drop cached results of an algorithm, or of one of its versions."""
+    
+    try:
+        deleted = await segmentation_service.invalidate_algorithm(algorithm_name, version=version, legacy=legacy)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"algorithm": algorithm_name, "version": version, "deleted": deleted}
+
 @router.get("/list")
 async def get_images_list(
     limit: int = 50,
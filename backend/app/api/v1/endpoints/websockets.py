@@ -6,11 +6,12 @@ import uuid
 import asyncio
 import structlog
 
+from app.dependencies import get_segmentation_service
 from app.services.segmentation_service import SegmentationService
-from app.services.image_service import ImageService
-from app.services.cache_service import CacheService
 from app.schemas.websocket import WSMessage, WSResponse, WSConnectionInfo
 from app.schemas.segmentation import SegmentationRequest
+from app.ml.warm_start import get_warm_start_store
+from app.config import settings
 
 logger = structlog.get_logger()
 router = APIRouter()
@@ -40,13 +41,14 @@ class ConnectionManager:
             del self.active_connections[connection_id]
         if connection_id in self.connection_info:
             del self.connection_info[connection_id]
+        get_warm_start_store().discard_session(connection_id)
         logger.info("WebSocket connection closed", connection_id=connection_id)
     
     async def send_personal_message(self, message: dict, connection_id: str):
         if connection_id in self.active_connections:
             websocket = self.active_connections[connection_id]
             try:
-                await websocket.send_text(json.dumps(message))
+                await websocket.send_text(json.dumps(message, default=str))
             except Exception as e:
                 logger.error("Failed to send WebSocket message", 
                            connection_id=connection_id, error=str(e))
@@ -56,7 +58,7 @@ class ConnectionManager:
         disconnected_connections = []
         for connection_id, websocket in self.active_connections.items():
             try:
-                await websocket.send_text(json.dumps(message))
+                await websocket.send_text(json.dumps(message, default=str))
             except Exception as e:
                 logger.error("Failed to broadcast WebSocket message", 
                            connection_id=connection_id, error=str(e))
@@ -68,11 +70,6 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
-def get_segmentation_service() -> SegmentationService:
-    cache_service = CacheService()
-    image_service = ImageService()
-    return SegmentationService(cache_service, image_service)
-
 # Основний ендпоінт для нових підключень
 @router.websocket("")
 async def websocket_endpoint_new(
@@ -181,9 +178,10 @@ async def handle_parameter_update(
         async def progress_callback(update):
             await manager.send_personal_message(update, connection_id)
         
-        # Process segmentation
+        # Process segmentation; a low-resolution preview is streamed first if the client asks for one
+        progressive = bool(message.get("progressive", settings.ENABLE_PROGRESSIVE_PREVIEWS))
         result = await segmentation_service.process_segmentation_request(
-            request, callback=progress_callback
+            request, callback=progress_callback, session_id=connection_id, progressive=progressive
         )
         
         # Send result
@@ -192,6 +190,7 @@ async def handle_parameter_update(
             "algorithm_name": algorithm_name,
             "parameter_name": parameter_name,
             "parameter_value": parameter_value,
+            "resolution_level": 0,
             "result": result.dict()
         }, connection_id)
         
@@ -222,7 +221,7 @@ async def handle_start_segmentation(
         
         # Process segmentation
         result = await segmentation_service.process_segmentation_request(
-            request, callback=progress_callback
+            request, callback=progress_callback, session_id=connection_id
         )
         
         # Send final result
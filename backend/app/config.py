@@ -36,22 +36,85 @@ class Settings(BaseSettings):
     # Redis
     REDIS_URL: str = "redis://redis:6379"
     REDIS_CACHE_TTL: int = 3600  # 1 hour
+    REDIS_MAX_CONNECTIONS: int = 32  # pool of the one client shared by the whole worker
+    # In-process tier in front of Redis (per worker; peers are invalidated over Redis pub/sub)
+    LOCAL_CACHE_MAX_ENTRIES: int = 1024
+    LOCAL_CACHE_MAX_BYTES: int = 32 * 1024 * 1024  # 32MB
+    CACHE_INVALIDATION_BATCH_SIZE: int = 500  # keys per UNLINK/SCAN step when invalidating
     
     # File Upload
     UPLOAD_PATH: str = "/app/uploads"
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_FILE_TYPES: List[str] = ["image/jpeg", "image/png", "image/bmp", "image/tiff"]
+    STORE_RAW_PIXELS: bool = True  # also keep uploads as memory-mappable RGB .npy, so segmentation never decodes
+    IMAGE_INDEX_BACKEND: str = "auto"  # auto (Redis when connected, else SQLite) | redis | sqlite
+    IMAGE_INDEX_PATH: str = ""  # SQLite file; defaults to UPLOAD_PATH/images.sqlite3
+    DEDUPLICATE_UPLOADS: bool = True  # uploads with the same pixels (content hash) share one stored image
     
     # ML Configuration
+    # Larger uploads are downscaled. Raising this above TILED_SEGMENTATION_THRESHOLD enables tiling, but the API
+    # process still holds the whole image, its int32 labels and the encode buffers of every such job
     MAX_IMAGE_DIMENSION: int = 2048
     DEFAULT_RESIZE_DIMENSION: int = 512
     
     # Performance
     MAX_CONCURRENT_SEGMENTATIONS: int = 4
     SEGMENTATION_TIMEOUT: int = 60  # seconds
+    CANONICALIZE_PARAMETERS: bool = True  # merge defaults, clamp and snap parameters to their step before keying the cache
+    COALESCE_SEGMENTATIONS: bool = True  # identical concurrent jobs share one computation (a Redis lease across workers)
+    SEGMENTATION_LEASE_TTL: int = 120  # seconds a worker may hold a job before peers compute it themselves; keep above SEGMENTATION_TIMEOUT
+    SEGMENTATION_LEASE_POLL_INTERVAL: float = 0.1  # seconds between checks while a peer holds the lease
+    IO_THREADS: int = 4  # thread pool for upload/result file I/O and image decode/encode
+    
+    # Segmentation executors ("process", "thread" or "inline")
+    SEGMENTATION_EXECUTOR: str = "process"
+    SEGMENTATION_EXECUTOR_OVERRIDES: Dict[str, str] = {}  # algorithm name -> executor kind
+    SEGMENTATION_WORKERS: int = 0  # 0 = min(MAX_CONCURRENT_SEGMENTATIONS, CPU count)
+    SEGMENTATION_MP_START_METHOD: str = "spawn"
+    SEGMENTATION_WORKER_AFFINITY: bool = True  # route jobs for the same image/algorithm to the same worker
+    
+    # Shared memory handoff to worker processes (memory-mapped files on tmpfs)
+    ENABLE_SHARED_MEMORY: bool = True
+    SHARED_MEMORY_PATH: str = "/dev/shm/segmentation"
+    SHARED_MEMORY_MAX_BYTES: int = 512 * 1024 * 1024  # 512MB
+    
+    # Decoded uploads (read-only RGB arrays) cached in the API process by image id
+    IMAGE_CACHE_MAX_BYTES: int = 512 * 1024 * 1024  # 512MB
+    
+    # Derived image representations (normalized, grayscale, Lab, ...) cached per process
+    FEATURE_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # 256MB
+    
+    # Warm starts for interactive updates, kept per (WebSocket session, image, algorithm)
+    ENABLE_WARM_START: bool = True
+    WARM_START_MAX_ENTRIES: int = 256
+    WARM_START_MAX_BYTES: int = 16 * 1024 * 1024  # 16MB
+    SLIC_CONVERGENCE_TOL: float = 0.02  # mean center shift per iteration, as a fraction of the grid step; 0 = off
+    
+    # Progressive WebSocket updates: a downscaled preview is streamed before the full-resolution result.
+    # Off by default until the frontend renders "segmentation_preview"; a message can opt in with "progressive"
+    ENABLE_PROGRESSIVE_PREVIEWS: bool = False
+    PROGRESSIVE_PREVIEW_MAX_DIMENSION: int = 512
+    PYRAMID_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # 64MB
+    
+    # Tiled segmentation of large images: overlapping tiles run in parallel and are stitched at the seams
+    ENABLE_TILED_SEGMENTATION: bool = True
+    TILED_SEGMENTATION_THRESHOLD: int = 2048  # longest side above which an image is tiled
+    TILE_SIZE: int = 1024
+    TILE_OVERLAP: int = 64  # pixels shared with each neighbor, used to match segments across seams
+    TILED_MAX_PARALLEL_TILES: int = 0  # 0 = number of segmentation workers
+    
+    # Label maps of results, stored next to the rendered images so outputs can be rebuilt without segmenting
+    LABEL_STORE_COMPRESSION: bool = False  # deflate-compressed .npz instead of memory-mappable .npy
+    
+    # Result image encoding: "auto" picks palette PNG or lossless WebP by label count and RESULT_ENCODING_TARGET
+    RESULT_IMAGE_FORMAT: str = "auto"  # auto | palette_png | png | webp
+    RESULT_ENCODING_TARGET: str = "latency"  # latency | size
+    RESULT_PNG_COMPRESS_LEVEL: int = 6  # zlib level 0-9
     
     # Monitoring
     ENABLE_METRICS: bool = True
+    MEMORY_PROFILER: str = "tracemalloc"  # peak/net memory per pipeline stage: "tracemalloc", "rss" or "off"
+    MEMORY_SAMPLE_INTERVAL: float = 0.005  # seconds between RSS samples with MEMORY_PROFILER="rss"
     METRICS_PORT: int = 9090
     
     class Config:
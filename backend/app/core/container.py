@@ -0,0 +1,80 @@
+# app/core/container.py
+from typing import Dict, Optional
+
+import redis.asyncio as redis
+import structlog
+
+from app.db.image_index import close_image_index, init_image_index
+from app.db.redis import close_redis, create_redis_client
+from app.ml.algorithms import BaseSegmentationAlgorithm
+from app.ml.executors import SegmentationExecutor, get_executors, init_executors, shutdown_executors
+from app.services.cache_service import CacheService, start_invalidation_listener, stop_invalidation_listener
+from app.services.image_service import ImageService
+from app.services.segmentation_service import SegmentationService
+from app.utils.file_io import shutdown_io_executor
+from app.utils.performance import startup_phase
+
+logger = structlog.get_logger()
+
+
+class ServiceContainer:
+    """Services shared by every request for the lifetime of the application.
+    
+    Owns the one connection-pooled Redis client (None when Redis is unreachable),
+    the image, cache and segmentation services, the algorithm registry and the
+    segmentation executors. Endpoints get them through app.dependencies.
+    """
+    
+    def __init__(self, redis_client: Optional[redis.Redis] = None):
+        self.redis = redis_client
+        self.image_service = ImageService()
+        self.cache_service = CacheService(redis_client)
+        self.segmentation_service = SegmentationService(self.cache_service, self.image_service)
+    
+    @property
+    def algorithms(self) -> Dict[str, BaseSegmentationAlgorithm]:
+        return self.segmentation_service.algorithms
+    
+    @property
+    def executors(self) -> Dict[str, SegmentationExecutor]:
+        return get_executors()
+
+
+_container: Optional[ServiceContainer] = None
+
+
+async def init_container() -> ServiceContainer:
+    """Connect to Redis, create the services and start the executors (application startup)."""
+    global _container
+    with startup_phase("redis"):
+        redis_client = await create_redis_client()
+        await start_invalidation_listener(redis_client)
+    init_image_index(redis_client)
+    
+    with startup_phase("services"):
+        _container = ServiceContainer(redis_client)
+    
+    # Start pre-warmed segmentation workers
+    with startup_phase("executors"):
+        await init_executors()
+    return _container
+
+
+async def close_container() -> None:
+    """Stop the executors and release every connection (application shutdown)."""
+    global _container
+    container, _container = _container, None
+    await stop_invalidation_listener()
+    await shutdown_executors()
+    close_image_index()
+    shutdown_io_executor()
+    if container is not None:
+        await close_redis(container.redis)
+
+
+def get_container() -> ServiceContainer:
+    """The application's container; outside the app (scripts) one without Redis is created."""
+    global _container
+    if _container is None:
+        _container = ServiceContainer()
+    return _container
@@ -0,0 +1,214 @@
+# app/db/image_index.py
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Dict, Optional
+
+import structlog
+
+from app.config import settings
+from app.utils.file_io import run_io
+
+logger = structlog.get_logger()
+
+
+@dataclass
+class ImageRecord:
+    """What is known about an upload without opening it."""
+    image_id: str
+    filename: str  # encoded file in UPLOAD_PATH
+    format: str  # Pillow format name of that file, e.g. "JPEG"
+    content_type: str
+    width: int
+    height: int
+    size: int  # bytes of the encoded file
+    content_hash: str = ""  # BLAKE2b of the RGB pixels and their shape; empty until known
+    original_filename: str = ""
+    raw_filename: Optional[str] = None  # memory-mappable RGB .npy, if stored
+    created_at: float = 0.0
+
+    @property
+    def url(self) -> str:
+        return f"/uploads/{self.filename}"
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ImageRecord":
+        values = {}
+        for field in fields(cls):
+            value = data.get(field.name)
+            if value is None or value == "":
+                continue
+            if field.type is int:
+                value = int(value)
+            elif field.type is float:
+                value = float(value)
+            values[field.name] = value
+        return cls(**values)
+
+
+class ImageIndex(ABC):
+    """Image metadata by image id; one lookup instead of probing the upload directory."""
+
+    backend = "none"
+
+    @abstractmethod
+    async def add(self, record: ImageRecord) -> None:
+        pass
+
+    @abstractmethod
+    async def get(self, image_id: str) -> Optional[ImageRecord]:
+        pass
+
+    @abstractmethod
+    async def find_by_hash(self, content_hash: str) -> Optional[ImageRecord]:
+        """The most recently indexed upload with these pixels."""
+        pass
+
+    @abstractmethod
+    async def delete(self, image_id: str) -> None:
+        pass
+
+
+class SQLiteImageIndex(ImageIndex):
+    """Index in a local SQLite file, queried on the I/O pool."""
+
+    backend = "sqlite"
+    _COLUMNS = [field.name for field in fields(ImageRecord)]
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS images ("
+                "image_id TEXT PRIMARY KEY, filename TEXT NOT NULL, format TEXT, content_type TEXT, "
+                "width INTEGER, height INTEGER, size INTEGER, content_hash TEXT, "
+                "original_filename TEXT, raw_filename TEXT, created_at REAL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS images_content_hash ON images (content_hash)")
+
+    def _add(self, record: ImageRecord) -> None:
+        placeholders = ", ".join("?" for _ in self._COLUMNS)
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO images ({', '.join(self._COLUMNS)}) VALUES ({placeholders})",
+                [getattr(record, column) for column in self._COLUMNS]
+            )
+
+    def _get(self, image_id: str) -> Optional[ImageRecord]:
+        with self._lock:
+            row = self._connection.execute("SELECT * FROM images WHERE image_id = ?", (image_id,)).fetchone()
+        return ImageRecord.from_dict(dict(row)) if row else None
+
+    def _find_by_hash(self, content_hash: str) -> Optional[ImageRecord]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT * FROM images WHERE content_hash = ? ORDER BY created_at DESC LIMIT 1", (content_hash,)
+            ).fetchone()
+        return ImageRecord.from_dict(dict(row)) if row else None
+
+    def _delete(self, image_id: str) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM images WHERE image_id = ?", (image_id,))
+
+    async def add(self, record: ImageRecord) -> None:
+        await run_io(self._add, record)
+
+    async def get(self, image_id: str) -> Optional[ImageRecord]:
+        return await run_io(self._get, image_id)
+
+    async def find_by_hash(self, content_hash: str) -> Optional[ImageRecord]:
+        if not content_hash:
+            return None
+        return await run_io(self._find_by_hash, content_hash)
+
+    async def delete(self, image_id: str) -> None:
+        await run_io(self._delete, image_id)
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+def _text(value: Any) -> str:
+    # The shared Redis client returns bytes
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RedisImageIndex(ImageIndex):
+    """Index in Redis hashes, shared by every API process.
+
+    Content hashes map to image ids through plain keys next to the hashes.
+    """
+
+    backend = "redis"
+
+    def __init__(self, client, prefix: str = "image_meta:", hash_prefix: str = "image_hash:"):
+        self.client = client
+        self.prefix = prefix
+        self.hash_prefix = hash_prefix
+
+    async def add(self, record: ImageRecord) -> None:
+        mapping = {key: value for key, value in asdict(record).items() if value is not None}
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.hset(f"{self.prefix}{record.image_id}", mapping=mapping)
+            if record.content_hash:
+                pipe.set(f"{self.hash_prefix}{record.content_hash}", record.image_id)
+            await pipe.execute()
+
+    async def get(self, image_id: str) -> Optional[ImageRecord]:
+        data = await self.client.hgetall(f"{self.prefix}{image_id}")
+        if not data:
+            return None
+        return ImageRecord.from_dict({_text(key): _text(value) for key, value in data.items()})
+
+    async def find_by_hash(self, content_hash: str) -> Optional[ImageRecord]:
+        if not content_hash:
+            return None
+        image_id = await self.client.get(f"{self.hash_prefix}{content_hash}")
+        return await self.get(_text(image_id)) if image_id else None
+
+    async def delete(self, image_id: str) -> None:
+        record = await self.get(image_id)
+        keys = [f"{self.prefix}{image_id}"]
+        if record is not None and record.content_hash:
+            keys.append(f"{self.hash_prefix}{record.content_hash}")
+        await self.client.delete(*keys)
+
+
+_index: Optional[ImageIndex] = None
+
+
+def init_image_index(redis_client=None) -> ImageIndex:
+    """Create the image index: Redis when connected (IMAGE_INDEX_BACKEND "auto"), else SQLite."""
+    global _index
+    backend = settings.IMAGE_INDEX_BACKEND
+    if backend not in ("auto", "redis", "sqlite"):
+        raise ValueError(f"Unknown image index backend: {backend}")
+    if backend == "redis" or (backend == "auto" and redis_client is not None):
+        if redis_client is None:
+            raise RuntimeError("IMAGE_INDEX_BACKEND is redis but Redis is not connected")
+        _index = RedisImageIndex(redis_client)
+    else:
+        _index = SQLiteImageIndex(settings.IMAGE_INDEX_PATH or os.path.join(settings.UPLOAD_PATH, "images.sqlite3"))
+    logger.info("Image index initialized", backend=_index.backend)
+    return _index
+
+
+def get_image_index() -> ImageIndex:
+    """Get the image index (a local SQLite one if init_image_index was not called)."""
+    if _index is None:
+        return init_image_index()
+    return _index
+
+
+def close_image_index() -> None:
+    global _index
+    if isinstance(_index, SQLiteImageIndex):
+        _index.close()
+    _index = None
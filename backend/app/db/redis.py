@@ -1,42 +1,37 @@
 # app/db/redis.py
+from typing import Optional
+
 import redis.asyncio as redis
 import structlog
 from app.config import settings
 
 logger = structlog.get_logger()
 
-# Global Redis connection
-redis_client = None
 
-async def init_redis():
-    """Initialize Redis connection."""
-    global redis_client
+async def create_redis_client() -> Optional[redis.Redis]:
+    """Create the application's connection-pooled Redis client; None if Redis is unreachable.
     
+    Responses are bytes (cache values are msgpack); callers decode text themselves.
+    """
+    client = redis.from_url(
+        settings.REDIS_URL,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        socket_keepalive=True,
+        health_check_interval=30
+    )
     try:
-        redis_client = redis.from_url(
-            settings.REDIS_URL,
-            encoding="utf-8",
-            decode_responses=True,
-            socket_keepalive=True,
-            socket_keepalive_options={},
-            health_check_interval=30
-        )
-        
         # Test connection
-        await redis_client.ping()
+        await client.ping()
         logger.info("Redis connection established", url=settings.REDIS_URL)
-        
+        return client
     except Exception as e:
         logger.error("Failed to connect to Redis", error=str(e))
-        redis_client = None
+        await client.close()
+        return None
 
-async def get_redis():
-    """Get Redis client instance."""
-    return redis_client
 
-async def close_redis():
-    """Close Redis connection."""
-    global redis_client
-    if redis_client:
-        await redis_client.close()
+async def close_redis(client: Optional[redis.Redis]) -> None:
+    """Close a client and its connection pool."""
+    if client is not None:
+        await client.close()
         logger.info("Redis connection closed")
@@ -1,18 +1,26 @@
 # app/main.py
+import time
+
+_import_start = time.perf_counter()
+
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
+import asyncio
 import structlog
-import time
 import psutil
 import os
 
 from app.config import settings
 from app.api.v1.api import api_router
-from app.db.redis import init_redis
-from app.db.database import init_db
+from app.core.container import close_container, init_container
+from app.ml.executors import get_executors_info
+from app.services.cache_service import get_cache_stats
+from app.services.image_service import get_image_cache
+from app.services.segmentation_service import get_result_cache_stats
+from app.utils.performance import get_startup_report, record_import_time, startup_phase
 
 # Configure structured logging
 structlog.configure(
@@ -128,24 +136,31 @@ async def general_exception_handler(request: Request, exc: Exception):
 async def startup_event():
     logger.info("Starting Image Segmentation Service", version=settings.APP_VERSION)
     
-    # Initialize Redis connection
-    await init_redis()
-    logger.info("Redis connection initialized")
-    
-    # Initialize database (if using PostgreSQL)
-    if settings.DATABASE_URL:
-        await init_db()
-        logger.info("Database connection initialized")
-    
     # Create upload directory
     os.makedirs(settings.UPLOAD_PATH, exist_ok=True)
     logger.info("Upload directory created", path=settings.UPLOAD_PATH)
     
-    logger.info("Service startup completed")
+    # Shared services: pooled Redis client, image/cache/segmentation services, pre-warmed executors
+    container = await init_container()
+    logger.info(
+        "Services initialized",
+        redis=container.redis is not None,
+        executors=get_executors_info()
+    )
+    
+    # Initialize database (if using PostgreSQL); SQLAlchemy is only imported when configured
+    if settings.DATABASE_URL:
+        with startup_phase("database"):
+            from app.db.database import init_db
+            await init_db()
+        logger.info("Database connection initialized")
+    
+    logger.info("Service startup completed", startup=get_startup_report())
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down Image Segmentation Service")
+    await close_container()
 
 # Health check endpoints
 @app.get("/health")
@@ -170,7 +185,8 @@ async def detailed_health_check():
         "version": settings.APP_VERSION,
         "timestamp": time.time(),
         "system": {
-            "cpu_percent": psutil.cpu_percent(interval=1),
+            # Sampling interval runs in a thread so the event loop stays free
+            "cpu_percent": await asyncio.to_thread(psutil.cpu_percent, 1),
             "memory": {
                 "total": memory.total,
                 "available": memory.available,
@@ -181,8 +197,12 @@ async def detailed_health_check():
                 "used": disk.used,
                 "free": disk.free,
                 "percent": (disk.used / disk.total) * 100
-            }
+            },
+            "executors": get_executors_info(),
+            "image_cache": get_image_cache().stats(),
+            "result_cache": {**get_result_cache_stats().stats(), "tiers": get_cache_stats()}
         },
+        "startup": get_startup_report(),
         "environment": settings.ENVIRONMENT
     }
 
@@ -193,6 +213,8 @@ if os.path.exists(settings.UPLOAD_PATH):
 # Include API routes
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+record_import_time("app.main", time.perf_counter() - _import_start)
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -1,25 +1,43 @@
 # app/ml/algorithms/__init__.py
-from .felzenszwalb import FelzenszwalbAlgorithm
-from .slic import SLICAlgorithm
-from .quickshift import QuickshiftAlgorithm
-from .watershed import WatershedAlgorithm
 from .base import BaseSegmentationAlgorithm, SegmentationMetrics
-from typing import Dict, Any, Tuple, Optional
+from typing import Dict, Any, Tuple, Optional, Type
 
-# Algorithm registry
-ALGORITHM_REGISTRY = {
-    "felzenszwalb": FelzenszwalbAlgorithm,
-    "slic": SLICAlgorithm,
-    "quickshift": QuickshiftAlgorithm,
-    "watershed": WatershedAlgorithm
+from app.utils.performance import lazy_import
+
+# Algorithm registry: name -> (module, class name). Modules are imported on first use,
+# so importing the registry does not pull in scikit-image
+ALGORITHM_REGISTRY: Dict[str, Tuple[str, str]] = {
+    "felzenszwalb": ("app.ml.algorithms.felzenszwalb", "FelzenszwalbAlgorithm"),
+    "slic": ("app.ml.algorithms.slic", "SLICAlgorithm"),
+    "quickshift": ("app.ml.algorithms.quickshift", "QuickshiftAlgorithm"),
+    "watershed": ("app.ml.algorithms.watershed", "WatershedAlgorithm")
 }
 
-def get_algorithm(name: str) -> BaseSegmentationAlgorithm:
-    """Get algorithm instance by name."""
+# Shared stateless instances, created on first use
+_instances: Dict[str, BaseSegmentationAlgorithm] = {}
+
+def get_algorithm_class(name: str) -> Type[BaseSegmentationAlgorithm]:
+    """Get algorithm class by name, importing its module if needed."""
     if name not in ALGORITHM_REGISTRY:
         raise ValueError(f"Unknown algorithm: {name}")
-    return ALGORITHM_REGISTRY[name]()
+    module_name, class_name = ALGORITHM_REGISTRY[name]
+    return getattr(lazy_import(module_name), class_name)
+
+def get_algorithm(name: str) -> BaseSegmentationAlgorithm:
+    """Get algorithm instance by name."""
+    algorithm = _instances.get(name)
+    if algorithm is None:
+        algorithm = get_algorithm_class(name)()
+        _instances[name] = algorithm
+    return algorithm
 
 def get_available_algorithms() -> Dict[str, BaseSegmentationAlgorithm]:
     """Get all available algorithms."""
-    return {name: cls() for name, cls in ALGORITHM_REGISTRY.items()}
\ No newline at end of file
+    return {name: get_algorithm(name) for name in ALGORITHM_REGISTRY}
+
+def __getattr__(name: str):
+    # Keep `from app.ml.algorithms import SLICAlgorithm` working without eager imports
+    for algorithm_name, (_, class_name) in ALGORITHM_REGISTRY.items():
+        if class_name == name:
+            return get_algorithm_class(algorithm_name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
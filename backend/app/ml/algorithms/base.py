@@ -5,16 +5,39 @@ import numpy as np
 import time
 from dataclasses import dataclass
 
+from app.ml.preprocessing import ImageFeatures
+from app.utils.performance import StageMemory, lazy_import
+from app.utils.validators import canonicalize_parameters
+
 @dataclass
 class SegmentationMetrics:
-    segments_count: int
     processing_time: float
-    memory_usage: Optional[float] = None
+    segments_count: int = 0  # filled in by the executor, with segment_stats
+    memory_usage: Optional[float] = None  # peak MB over all stages (filled in by the executor)
+    memory_net: Optional[float] = None  # MB left allocated
+    # Peak and net memory per pipeline stage ("segment", "statistics", ...), see MemoryProfiler
+    memory_stages: Optional[Dict[str, StageMemory]] = None
     parameters_used: Optional[Dict[str, Any]] = None
+    # Segment size summary from app.ml.metrics (filled in by the executor)
+    segment_stats: Optional[Dict[str, Any]] = None
+    # Algorithm-specific state a later run can warm-start from (see supports_warm_start)
+    state: Optional[Dict[str, Any]] = None
 
 class BaseSegmentationAlgorithm(ABC):
     """Base class for all segmentation algorithms."""
     
+    # Executor kind ("process", "thread", "inline"); None uses settings.SEGMENTATION_EXECUTOR
+    preferred_executor: Optional[str] = None
+    
+    # Heavy libraries segment() imports lazily; preloaded by warm_up() in worker processes
+    required_modules: Tuple[str, ...] = ()
+    
+    # Whether segment() accepts ``warm_start`` (the metrics.state of a previous run on the same image)
+    supports_warm_start: bool = False
+    
+    # Bump when a change alters results; cached results are tagged with it for invalidation
+    version: str = "1"
+    
     def __init__(self, name: str, display_name: str):
         self.name = name
         self.display_name = display_name
@@ -30,19 +53,63 @@ class BaseSegmentationAlgorithm(ABC):
         pass
     
     @abstractmethod
-    def segment(self, image: np.ndarray, parameters: Dict[str, Any]) -> Tuple[np.ndarray, SegmentationMetrics]:
+    def segment(
+        self,
+        image: np.ndarray,
+        parameters: Dict[str, Any],
+        features: Optional[ImageFeatures] = None
+    ) -> Tuple[np.ndarray, SegmentationMetrics]:
         """
         Perform image segmentation.
         
         Args:
             image: Input image as numpy array (H, W, 3)
             parameters: Algorithm parameters
+            features: Cached derived representations of ``image`` shared across algorithms
             
         Returns:
             Tuple of (segmented_labels, metrics)
         """
         pass
     
+    def canonicalize_parameters(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """Parameters as the algorithm will see them: defaults merged, coerced, clamped
+        to get_parameter_ranges() and snapped to their step, so equal settings key the
+        result cache identically. Raises ValueError for invalid values.
+        """
+        return canonicalize_parameters(parameters, self.get_default_parameters(), self.get_parameter_ranges())
+    
+    def scale_parameters(self, parameters: Dict[str, Any], scale: float) -> Dict[str, Any]:
+        """Parameters for the same image resized by ``scale`` (e.g. a pyramid preview).
+        
+        Defaults are filled in; algorithms rescale their pixel-unit parameters.
+        """
+        return {**self.get_default_parameters(), **parameters}
+    
+    def crop_parameters(self, parameters: Dict[str, Any], area_fraction: float) -> Dict[str, Any]:
+        """Parameters for a crop covering ``area_fraction`` of the image (e.g. one tile).
+        
+        Defaults are filled in; algorithms rescale parameters that count segments per image.
+        """
+        return {**self.get_default_parameters(), **parameters}
+    
+    def segment_size(self, parameters: Dict[str, Any], shape: Tuple[int, ...]) -> Optional[float]:
+        """Typical segment diameter in pixels on an image of ``shape``, if the parameters fix one."""
+        return None
+    
+    def scale_state(self, state: Dict[str, Any], scale: float, shape: Tuple[int, ...]) -> Optional[Dict[str, Any]]:
+        """Warm-start state of a run on the same image resized by ``scale`` to ``shape``, if reusable."""
+        return None
+    
+    def warm_up(self) -> None:
+        """Import the libraries this algorithm needs so the first job does not pay for them."""
+        for module_name in self.required_modules:
+            lazy_import(module_name)
+    
+    def get_features(self, image: np.ndarray, features: Optional[ImageFeatures] = None) -> ImageFeatures:
+        """Use the shared feature cache entry if given, otherwise a private one for this call."""
+        return features if features is not None else ImageFeatures(image)
+    
     def preprocess_image(self, image: np.ndarray) -> np.ndarray:
         """Preprocess image before segmentation."""
         # Convert to float and normalize to [0, 1]
@@ -1,16 +1,103 @@
-import os
 import time
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Optional, Tuple
 
 import numpy as np
-import psutil
-from skimage.segmentation import felzenszwalb
-from skimage.measure import regionprops
+
+from app.ml.preprocessing import ImageFeatures
 
 from .base import BaseSegmentationAlgorithm, SegmentationMetrics
 
+# Pixel edges of Felzenszwalb's 8-connected grid graph: right, down, down-right, up-right
+_EDGE_SLICES = (
+    ((slice(None), slice(None, -1)), (slice(None), slice(1, None))),
+    ((slice(None, -1), slice(None)), (slice(1, None), slice(None))),
+    ((slice(None, -1), slice(None, -1)), (slice(1, None), slice(1, None))),
+    ((slice(1, None), slice(None, -1)), (slice(None, -1), slice(1, None))),
+)
+
+
+def _boundary_graph(labels: np.ndarray, smoothed: np.ndarray, segments_count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Segment pairs joined by pixel edges, in the order the sorted edge queue first reaches them.
+
+    Only edges crossing a segment boundary matter once the scale pass is done, and
+    of those only the cheapest edge per segment pair: later edges of the same pair
+    see the same two components, so the small-segment pass ignores them. Equal-cost
+    edges are visited in stable order (skimage's argsort is unstable), so images with
+    many exact ties may merge small segments slightly differently than skimage does.
+    """
+    if smoothed.ndim == 2:
+        smoothed = smoothed[..., np.newaxis]
+    labels_a, labels_b, costs = [], [], []
+    for slice_a, slice_b in _EDGE_SLICES:
+        a, b = labels[slice_a], labels[slice_b]
+        crossing = a != b
+        diff = smoothed[slice_a][crossing] - smoothed[slice_b][crossing]
+        # Same expression and precision as skimage's edge costs
+        costs.append(np.sqrt(np.sum(diff * diff, axis=-1)).astype(np.float64))
+        labels_a.append(a[crossing])
+        labels_b.append(b[crossing])
+    order = np.argsort(np.concatenate(costs), kind="stable")
+    a = np.concatenate(labels_a)[order]
+    b = np.concatenate(labels_b)[order]
+    low = np.minimum(a, b).astype(np.int64)
+    high = np.maximum(a, b).astype(np.int64)
+    _, first = np.unique(low * segments_count + high, return_index=True)
+    first.sort()
+    return low[first].astype(np.int32), high[first].astype(np.int32)
+
+
+def _merge_small_segments(
+    labels: np.ndarray,
+    segments_count: int,
+    pairs_a: np.ndarray,
+    pairs_b: np.ndarray,
+    min_size: int
+) -> np.ndarray:
+    """Felzenszwalb's min_size post-processing, run on the segment graph instead of pixels."""
+    sizes = np.bincount(labels.ravel(), minlength=segments_count).tolist()
+    small = sum(1 for size in sizes if size < min_size)
+    parent = list(range(segments_count))
+
+    def find(node):
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    for a, b in zip(pairs_a.tolist(), pairs_b.tolist()):
+        if small == 0:
+            break
+        root_a, root_b = find(a), find(b)
+        if root_a == root_b:
+            continue
+        if sizes[root_a] < min_size or sizes[root_b] < min_size:
+            # Lowest label wins, as in skimage, so final label order matches
+            if root_b < root_a:
+                root_a, root_b = root_b, root_a
+            small -= (sizes[root_a] < min_size) + (sizes[root_b] < min_size)
+            parent[root_b] = root_a
+            sizes[root_a] += sizes[root_b]
+            small += sizes[root_a] < min_size
+
+    roots = np.fromiter((find(node) for node in range(segments_count)), dtype=np.int64, count=segments_count)
+    _, relabel = np.unique(roots, return_inverse=True)
+    return relabel.astype(np.int32)[labels]
+
+
 class FelzenszwalbAlgorithm(BaseSegmentationAlgorithm):
-    """Felzenszwalb's efficient graph-based segmentation."""
+    """Felzenszwalb's efficient graph-based segmentation.
+    
+    Partly incremental against the feature cache: the smoothed image is cached per
+    sigma, and the scale pass (labels plus the sorted segment boundary graph) per
+    (sigma, scale), so a min_size change only redoes the small-segment merge. A
+    scale change reruns skimage's compiled scale pass on the cached smoothed image;
+    replaying it over pixel edges pre-sorted per sigma would need a union-find over
+    every pixel edge, which in Python is several times slower than that rerun.
+    """
+    
+    required_modules = ("skimage.segmentation", "scipy.ndimage")
     
     def __init__(self):
         super().__init__("felzenszwalb", "Felzenszwalb")
@@ -29,36 +116,56 @@ class FelzenszwalbAlgorithm(BaseSegmentationAlgorithm):
             "min_size": {"min": 10, "max": 500, "step": 10, "type": "int"}
         }
     
-    def segment(self, image: np.ndarray, parameters: Dict[str, Any]) -> Tuple[np.ndarray, SegmentationMetrics]:
+    def scale_parameters(self, parameters: Dict[str, Any], scale: float) -> Dict[str, Any]:
+        scaled = super().scale_parameters(parameters, scale)
+        # min_size is an area and sigma a length; scale is left as is, since the
+        # coarser image already has proportionally stronger edges
+        scaled["sigma"] = float(scaled["sigma"]) * scale
+        scaled["min_size"] = max(1, int(round(int(scaled["min_size"]) * scale ** 2)))
+        return scaled
+    
+    def segment(
+        self,
+        image: np.ndarray,
+        parameters: Dict[str, Any],
+        features: Optional[ImageFeatures] = None
+    ) -> Tuple[np.ndarray, SegmentationMetrics]:
         start_time = time.time()
-        process = psutil.Process(os.getpid())
-        memory_before = process.memory_info().rss / 1024 / 1024  # MB
         
-        # Preprocess image
-        processed_image = self.preprocess_image(image)
+        image_features = self.get_features(image, features)
+        sigma = float(parameters.get("sigma", 0.5))
+        scale = float(parameters.get("scale", 100))
+        min_size = int(parameters.get("min_size", 50))
         
-        # Apply Felzenszwalb segmentation
-        labels = felzenszwalb(
-            processed_image,
-            scale=parameters.get("scale", 100),
-            sigma=parameters.get("sigma", 0.5),
-            min_size=parameters.get("min_size", 50)
-        )
+        # Scale pass over the cached smoothed image (only redone when sigma or scale change)
+        first_labels, pairs_a, pairs_b = self._scale_pass(image_features, sigma, scale)
+        
+        # Small-segment merge on the segment graph
+        labels = _merge_small_segments(first_labels, int(first_labels.max()) + 1, pairs_a, pairs_b, min_size)
         
         # Postprocess labels
         labels = self.postprocess_labels(labels)
         
         # Calculate metrics
         processing_time = time.time() - start_time
-        memory_after = process.memory_info().rss / 1024 / 1024
-        memory_usage = memory_after - memory_before
-        segments_count = len(np.unique(labels))
         
         metrics = SegmentationMetrics(
-            segments_count=segments_count,
             processing_time=processing_time,
-            memory_usage=memory_usage,
             parameters_used=parameters
         )
         
         return labels, metrics
+    
+    def _scale_pass(self, features: ImageFeatures, sigma: float, scale: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Felzenszwalb without the min_size pass, plus its boundary graph; cached per (sigma, scale).
+        
+        A new scale is a full (compiled) pass; only the smoothing is reused.
+        """
+        def compute():
+            from skimage.segmentation import felzenszwalb
+            smoothed = features.smoothed(sigma)
+            # Smoothing is already applied (sigma=0) and min_size=1 disables the small-segment pass
+            labels = felzenszwalb(smoothed, scale=scale, sigma=0, min_size=1).astype(np.int32)
+            pairs_a, pairs_b = _boundary_graph(labels, smoothed, int(labels.max()) + 1)
+            return labels, pairs_a, pairs_b
+        return features.get_or_compute(("felzenszwalb", sigma, scale), compute)
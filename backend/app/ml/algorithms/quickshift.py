@@ -1,16 +1,40 @@
-import os
 import time
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Optional, Tuple
 
 import numpy as np
-import psutil
-from skimage.segmentation import quickshift
+
+from app.ml.preprocessing import ImageFeatures
 
 from .base import BaseSegmentationAlgorithm, SegmentationMetrics
 
 
+def _cut_tree(parent: np.ndarray, parent_dist: np.ndarray, max_dist: float) -> np.ndarray:
+    """Cut the Quickshift forest at max_dist and label each pixel by its root.
+
+    Equivalent to the last step of skimage's quickshift: links longer than max_dist
+    become roots, pointer jumping flattens the forest, and labels follow root order.
+    """
+    index = np.arange(parent.size, dtype=parent.dtype)
+    flat = np.where(parent_dist.ravel() > max_dist, index, parent.ravel())
+    while True:
+        jumped = flat[flat]
+        if np.array_equal(jumped, flat):
+            break
+        flat = jumped
+    roots = flat == index
+    rank = np.cumsum(roots, dtype=np.int32) - 1
+    return rank[flat].reshape(parent.shape)
+
+
 class QuickshiftAlgorithm(BaseSegmentationAlgorithm):
-    """Quickshift image segmentation."""
+    """Quickshift image segmentation.
+    
+    The density estimate and parent links depend only on kernel_size and ratio;
+    they are cached per image in the feature cache, so a max_dist change is just
+    a vectorized re-cut of the cached tree.
+    """
+    
+    required_modules = ("skimage.segmentation", "skimage.color")
     
     def __init__(self):
         super().__init__("quickshift", "Quickshift")
@@ -29,37 +53,57 @@ class QuickshiftAlgorithm(BaseSegmentationAlgorithm):
             "ratio": {"min": 0.1, "max": 1.0, "step": 0.1, "type": "float"}
         }
     
-    def segment(self, image: np.ndarray, parameters: Dict[str, Any]) -> Tuple[np.ndarray, SegmentationMetrics]:
+    def scale_parameters(self, parameters: Dict[str, Any], scale: float) -> Dict[str, Any]:
+        scaled = super().scale_parameters(parameters, scale)
+        # Kernel width is a spatial distance (skimage needs kernel_size >= 1); max_dist
+        # is measured in the joint color/position space and is left as is
+        scaled["kernel_size"] = max(1.0, float(scaled["kernel_size"]) * scale)
+        return scaled
+    
+    def segment(
+        self,
+        image: np.ndarray,
+        parameters: Dict[str, Any],
+        features: Optional[ImageFeatures] = None
+    ) -> Tuple[np.ndarray, SegmentationMetrics]:
         start_time = time.time()
-        process = psutil.Process(os.getpid())
-        memory_before = process.memory_info().rss / 1024 / 1024
         
-        # Preprocess image
-        processed_image = self.preprocess_image(image)
+        image_features = self.get_features(image, features)
+        kernel_size = float(parameters.get("kernel_size", 3))
+        ratio = float(parameters.get("ratio", 0.5))
         
-        # Apply Quickshift segmentation
-        labels = quickshift(
-            processed_image,
-            kernel_size=parameters.get("kernel_size", 3),
-            max_dist=parameters.get("max_dist", 6),
-            ratio=parameters.get("ratio", 0.5),
-            channel_axis=-1
-        )
+        # Mode-seeking tree (only recomputed when kernel_size or ratio change)
+        parent, parent_dist = self._build_tree(image_features, kernel_size, ratio)
+        
+        # Cut links longer than max_dist
+        labels = _cut_tree(parent, parent_dist, float(parameters.get("max_dist", 6)))
         
         # Postprocess labels
         labels = self.postprocess_labels(labels)
         
         # Calculate metrics
         processing_time = time.time() - start_time
-        memory_after = process.memory_info().rss / 1024 / 1024
-        memory_usage = memory_after - memory_before
-        segments_count = len(np.unique(labels))
         
         metrics = SegmentationMetrics(
-            segments_count=segments_count,
             processing_time=processing_time,
-            memory_usage=memory_usage,
             parameters_used=parameters
         )
         
         return labels, metrics
+    
+    def _build_tree(self, features: ImageFeatures, kernel_size: float, ratio: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Parent index and parent distance per pixel; cached per (kernel_size, ratio)."""
+        def compute():
+            from skimage.segmentation import quickshift
+            # An infinite max_dist leaves the tree uncut; the Lab image is shared via the feature cache
+            _, parent, parent_dist = quickshift(
+                features.lab,
+                kernel_size=kernel_size,
+                max_dist=np.inf,
+                ratio=ratio,
+                return_tree=True,
+                convert2lab=False,
+                channel_axis=-1
+            )
+            return np.asarray(parent, dtype=np.int32), np.asarray(parent_dist, dtype=np.float32)
+        return features.get_or_compute(("quickshift", kernel_size, ratio), compute)
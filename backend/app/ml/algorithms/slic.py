@@ -1,16 +1,37 @@
-import os
+import math
 import time
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Optional, Tuple
 
 import numpy as np
-import psutil
-from skimage.segmentation import slic
+
+from app.config import settings
+from app.ml.preprocessing import ImageFeatures
 
 from .base import BaseSegmentationAlgorithm, SegmentationMetrics
 
+# Same iteration budget as skimage.segmentation.slic
+MAX_NUM_ITER = 10
+
+
+def _has_slic_kernel() -> bool:
+    """Whether skimage's private k-means kernel is importable (it lets us seed the centers)."""
+    try:
+        from skimage.segmentation._slic import _enforce_label_connectivity_cython, _slic_cython  # noqa: F401
+        from skimage.segmentation.slic_superpixels import _get_grid_centroids  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
 
 class SLICAlgorithm(BaseSegmentationAlgorithm):
-    """Simple Linear Iterative Clustering (SLIC) superpixels."""
+    """Simple Linear Iterative Clustering (SLIC) superpixels.
+
+    Supports warm starts: given the cluster centers of a previous run on the same
+    image, k-means is seeded from them and stops once the centers settle.
+    """
+
+    required_modules = ("skimage.segmentation", "skimage.color", "skimage.filters", "scipy.spatial")
+    supports_warm_start = True
 
     def __init__(self):
         super().__init__("slic", "SLIC")
@@ -31,38 +52,185 @@ class SLICAlgorithm(BaseSegmentationAlgorithm):
             "start_label": {"min": 0, "max": 1, "step": 1, "type": "int"}
         }
 
-    def segment(self, image: np.ndarray, parameters: Dict[str, Any]) -> Tuple[np.ndarray, SegmentationMetrics]:
+    def scale_parameters(self, parameters: Dict[str, Any], scale: float) -> Dict[str, Any]:
+        # n_segments and compactness are relative to the grid step already
+        scaled = super().scale_parameters(parameters, scale)
+        scaled["sigma"] = float(scaled["sigma"]) * scale
+        return scaled
+
+    def crop_parameters(self, parameters: Dict[str, Any], area_fraction: float) -> Dict[str, Any]:
+        # Same superpixel size on every tile
+        cropped = super().crop_parameters(parameters, area_fraction)
+        cropped["n_segments"] = max(1, int(round(int(cropped["n_segments"]) * area_fraction)))
+        return cropped
+
+    def segment_size(self, parameters: Dict[str, Any], shape: Tuple[int, ...]) -> Optional[float]:
+        count = max(1, int(parameters.get("n_segments", self.get_default_parameters()["n_segments"])))
+        return math.sqrt(shape[0] * shape[1] / count)
+
+    def scale_state(self, state: Dict[str, Any], scale: float, shape: Tuple[int, ...]) -> Optional[Dict[str, Any]]:
+        """Move the (z, y, x, color...) centers onto the resized image."""
+        centers = np.array(state["centers"], dtype=np.float64)
+        centers[:, 1] = np.clip(centers[:, 1] * scale, 0, shape[0] - 1)
+        centers[:, 2] = np.clip(centers[:, 2] * scale, 0, shape[1] - 1)
+        return {**state, "centers": centers, "shape": tuple(shape)}
+
+    def segment(
+        self,
+        image: np.ndarray,
+        parameters: Dict[str, Any],
+        features: Optional[ImageFeatures] = None,
+        warm_start: Optional[Dict[str, Any]] = None
+    ) -> Tuple[np.ndarray, SegmentationMetrics]:
         start_time = time.time()
-        process = psutil.Process(os.getpid())
-        memory_before = process.memory_info().rss / 1024 / 1024
-
-        # Preprocess image
-        processed_image = self.preprocess_image(image)
-
-        # Apply SLIC segmentation
-        labels = slic(
-            processed_image,
-            n_segments=parameters.get("n_segments", 250),
-            compactness=parameters.get("compactness", 10),
-            sigma=parameters.get("sigma", 1),
-            start_label=parameters.get("start_label", 1),
-            channel_axis=-1
-        )
+
+        # Normalized float image, shared with other algorithms via the feature cache
+        image_features = self.get_features(image, features)
+        n_segments = int(parameters.get("n_segments", 250))
+        compactness = float(parameters.get("compactness", 10))
+        sigma = float(parameters.get("sigma", 1))
+        start_label = int(parameters.get("start_label", 1))
+
+        state = None
+        if _has_slic_kernel():
+            labels, state = self._slic(image_features, n_segments, compactness, sigma, start_label, warm_start)
+        else:
+            from skimage.segmentation import slic
+            labels = slic(
+                image_features.normalized,
+                n_segments=n_segments,
+                compactness=compactness,
+                sigma=sigma,
+                start_label=start_label,
+                channel_axis=-1
+            )
 
         # Postprocess labels
         labels = self.postprocess_labels(labels)
 
         # Calculate metrics
         processing_time = time.time() - start_time
-        memory_after = process.memory_info().rss / 1024 / 1024
-        memory_usage = memory_after - memory_before
-        segments_count = len(np.unique(labels))
 
         metrics = SegmentationMetrics(
-            segments_count=segments_count,
             processing_time=processing_time,
-            memory_usage=memory_usage,
-            parameters_used=parameters
+            parameters_used=parameters,
+            state=state
         )
 
         return labels, metrics
+
+    def _prepared_image(self, features: ImageFeatures, sigma: float) -> np.ndarray:
+        """Rescaled, Lab-converted and smoothed (1, H, W, 3) image, as skimage's slic prepares it."""
+        def compute():
+            from skimage.color import rgb2lab
+            from skimage.filters import gaussian
+            prepared = features.normalized.astype(np.float32, copy=True)
+            low, high = prepared.min(), prepared.max()
+            prepared -= low
+            if high != low:
+                prepared /= high - low
+            prepared = rgb2lab(prepared[np.newaxis, ...])
+            if sigma > 0:
+                prepared = gaussian(prepared, sigma=[sigma, sigma, sigma, 0], mode="reflect")
+            return prepared
+        return features.get_or_compute(("slic", sigma), compute)
+
+    def _slic(
+        self,
+        features: ImageFeatures,
+        n_segments: int,
+        compactness: float,
+        sigma: float,
+        start_label: int,
+        warm_start: Optional[Dict[str, Any]]
+    ) -> Tuple[np.ndarray, Dict[str, Any]]:
+        from skimage.segmentation._slic import _enforce_label_connectivity_cython, _slic_cython
+        from skimage.segmentation.slic_superpixels import _get_grid_centroids
+        prepared = self._prepared_image(features, sigma)
+        dtype = prepared.dtype
+        grid, steps = _get_grid_centroids(prepared, n_segments)
+        ratio = 1.0 / compactness
+
+        centers = self._initial_centers(grid, prepared.shape[-1], ratio, features.shape, warm_start)
+        warm = centers is not None
+        if not warm:
+            centers = np.concatenate([grid, np.zeros((grid.shape[0], prepared.shape[-1]))], axis=-1)
+        centers = np.ascontiguousarray(centers, dtype=dtype)
+
+        scaled = np.ascontiguousarray(prepared * ratio, dtype=dtype)
+        spacing = np.ones(3, dtype=dtype)
+        step = max(steps)
+        # Relative to the grid step so the criterion does not depend on image size
+        tolerance = settings.SLIC_CONVERGENCE_TOL * step
+
+        if warm and tolerance > 0:
+            # One k-means step at a time; the kernel updates centers in place
+            for iterations in range(1, MAX_NUM_ITER + 1):
+                previous = centers[:, :3].copy()
+                labels = _slic_cython(
+                    scaled, None, centers, step, 1, spacing, False,
+                    ignore_color=False, start_label=start_label
+                )
+                shift = np.abs(centers[:, :3] - previous).max(axis=1)
+                if np.nanmean(shift) <= tolerance:
+                    break
+        else:
+            iterations = MAX_NUM_ITER
+            labels = _slic_cython(
+                scaled, None, centers, step, MAX_NUM_ITER, spacing, False,
+                ignore_color=False, start_label=start_label
+            )
+
+        segment_size = math.prod(scaled.shape[:3]) / centers.shape[0]
+        labels = _enforce_label_connectivity_cython(
+            labels, int(0.5 * segment_size), int(3 * segment_size), start_label=start_label
+        )
+
+        state = {
+            "centers": centers,
+            "ratio": ratio,
+            "shape": tuple(features.shape),
+            "iterations": iterations,
+            "warm": warm
+        }
+        return np.asarray(labels)[0], state
+
+    @staticmethod
+    def _initial_centers(
+        grid: np.ndarray,
+        channels: int,
+        ratio: float,
+        shape: Tuple[int, ...],
+        warm_start: Optional[Dict[str, Any]]
+    ) -> Optional[np.ndarray]:
+        """Seed centers from a previous run, or None for a cold start.
+
+        Color coordinates are stored pre-scaled by 1 / compactness, so they are rescaled
+        when compactness changed. When n_segments changed, every new grid point takes
+        the nearest unused previous center and falls back to itself otherwise.
+        """
+        if not warm_start or tuple(warm_start.get("shape", ())) != tuple(shape):
+            return None
+        previous = np.asarray(warm_start["centers"], dtype=np.float64)
+        if previous.ndim != 2 or previous.shape[1] != 3 + channels:
+            return None
+        previous = previous.copy()
+        previous[:, 3:] *= ratio / warm_start["ratio"]
+        # Clusters that lost all their pixels come back as NaN; reseed those from the grid
+        finite = np.isfinite(previous).all(axis=1)
+        centers = np.concatenate([grid, np.zeros((grid.shape[0], channels))], axis=-1)
+        if previous.shape[0] == grid.shape[0]:
+            centers[finite] = previous[finite]
+            return centers
+
+        previous = previous[finite]
+        if not len(previous):
+            return None
+        from scipy.spatial import cKDTree
+        _, nearest = cKDTree(previous[:, :3]).query(grid)
+        used = np.zeros(previous.shape[0], dtype=bool)
+        for index, candidate in enumerate(nearest):
+            if not used[candidate]:
+                used[candidate] = True
+                centers[index] = previous[candidate]
+        return centers
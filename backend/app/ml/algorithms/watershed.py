@@ -1,62 +1,118 @@
-import os
 import time
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Optional, Tuple
 
 import numpy as np
-import psutil
-from skimage.feature import peak_local_max
-from skimage.filters import sobel
-from scipy import ndimage as ndi
-from skimage.segmentation import watershed  # Додано імпорт watershed
+
+from app.ml.preprocessing import ImageFeatures
 
 from .base import BaseSegmentationAlgorithm, SegmentationMetrics
 
+# Seeds are ranked once per (strategy, min_distance) up to the largest allowed marker count;
+# any smaller count is a prefix of that list, so marker changes only re-flood
+MAX_MARKERS = 1000
+
+MARKER_STRATEGIES = ("local_maxima", "distance_transform", "grid")
+
+
+def _local_maxima_seeds(elevation: np.ndarray, min_distance: int) -> np.ndarray:
+    """Peaks of the elevation map, strongest first."""
+    from skimage.feature import peak_local_max
+    return peak_local_max(elevation, min_distance=min_distance, num_peaks=MAX_MARKERS, exclude_border=False)
+
+
+def _distance_transform_seeds(elevation: np.ndarray, min_distance: int) -> np.ndarray:
+    """Centers of flat areas: peaks of the distance to the nearest strong edge, farthest first."""
+    from scipy import ndimage as ndi
+    from skimage.feature import peak_local_max
+    from skimage.filters import threshold_otsu
+    edges = elevation > threshold_otsu(elevation)
+    distance = ndi.distance_transform_edt(~edges)
+    return peak_local_max(distance, min_distance=min_distance, num_peaks=MAX_MARKERS, exclude_border=False)
+
+
+def _grid_seeds(shape: Tuple[int, ...], count: int) -> np.ndarray:
+    """About ``count`` seeds on a regular grid with square cells."""
+    height, width = shape[:2]
+    rows = int(np.clip(round(np.sqrt(count * height / width)), 1, height))
+    cols = int(np.clip(round(count / rows), 1, width))
+    row_coords = ((np.arange(rows) + 0.5) * height / rows).astype(np.intp)
+    col_coords = ((np.arange(cols) + 0.5) * width / cols).astype(np.intp)
+    grid_rows, grid_cols = np.meshgrid(row_coords, col_coords, indexing="ij")
+    return np.stack([grid_rows.ravel(), grid_cols.ravel()], axis=1)
+
+
+def place_markers(shape: Tuple[int, ...], seeds: np.ndarray) -> np.ndarray:
+    """Marker image with seed i labelled i + 1, in the smallest dtype watershed accepts."""
+    dtype = np.uint16 if len(seeds) < np.iinfo(np.uint16).max else np.int32
+    markers = np.zeros(shape[:2], dtype=dtype)
+    if len(seeds):
+        markers[seeds[:, 0], seeds[:, 1]] = np.arange(1, len(seeds) + 1, dtype=dtype)
+    return markers
+
 
 class WatershedAlgorithm(BaseSegmentationAlgorithm):
-    """Watershed segmentation algorithm."""
+    """Watershed segmentation algorithm.
+
+    The elevation map and ranked seed lists are cached per image, so changing
+    ``markers`` or ``compactness`` only repeats the flooding step.
+    """
     
+    required_modules = ("skimage.segmentation", "skimage.feature", "skimage.filters", "scipy.ndimage")
+
     def __init__(self):
         super().__init__("watershed", "Watershed")
     
     def get_default_parameters(self) -> Dict[str, Any]:
         return {
             "markers": 250,
-            "compactness": 0
+            "compactness": 0,
+            "marker_strategy": "local_maxima",
+            "min_distance": 10
         }
     
     def get_parameter_ranges(self) -> Dict[str, Dict[str, Any]]:
         return {
-            "markers": {"min": 50, "max": 1000, "step": 10, "type": "int"},
-            "compactness": {"min": 0, "max": 1, "step": 0.1, "type": "float"}
+            "markers": {"min": 50, "max": MAX_MARKERS, "step": 10, "type": "int"},
+            "compactness": {"min": 0, "max": 1, "step": 0.1, "type": "float"},
+            "marker_strategy": {"options": list(MARKER_STRATEGIES), "type": "string"},
+            "min_distance": {"min": 1, "max": 50, "step": 1, "type": "int"}
         }
     
-    def segment(self, image: np.ndarray, parameters: Dict[str, Any]) -> Tuple[np.ndarray, SegmentationMetrics]:
-        start_time = time.time()
-        process = psutil.Process(os.getpid())
-        memory_before = process.memory_info().rss / 1024 / 1024
-        
-        # Preprocess image
-        processed_image = self.preprocess_image(image)
-        
-        # Convert to grayscale for edge detection
-        if len(processed_image.shape) == 3:
-            gray_image = np.mean(processed_image, axis=2)
-        else:
-            gray_image = processed_image
+    def scale_parameters(self, parameters: Dict[str, Any], scale: float) -> Dict[str, Any]:
+        scaled = super().scale_parameters(parameters, scale)
+        scaled["min_distance"] = max(1, int(round(int(scaled["min_distance"]) * scale)))
+        return scaled
+
+    def crop_parameters(self, parameters: Dict[str, Any], area_fraction: float) -> Dict[str, Any]:
+        # Same marker density on every tile
+        cropped = super().crop_parameters(parameters, area_fraction)
+        cropped["markers"] = max(1, int(round(int(cropped["markers"]) * area_fraction)))
+        return cropped
+
+    def segment_size(self, parameters: Dict[str, Any], shape: Tuple[int, ...]) -> Optional[float]:
+        count = max(1, int(parameters.get("markers", self.get_default_parameters()["markers"])))
+        return float(np.sqrt(shape[0] * shape[1] / count))
+
+    def segment(
+        self,
+        image: np.ndarray,
+        parameters: Dict[str, Any],
+        features: Optional[ImageFeatures] = None
+    ) -> Tuple[np.ndarray, SegmentationMetrics]:
+        from skimage.segmentation import watershed
         
-        # Compute elevation map (edge magnitude)
-        elevation = sobel(gray_image)
+        start_time = time.time()
         
-        # Generate markers using local maxima
-        markers_count = parameters.get("markers", 250)
+        # Elevation map (edge magnitude) and seeds come from the shared feature cache
+        image_features = self.get_features(image, features)
+        elevation = image_features.elevation
         
-        # Find local maxima as markers using correct function and syntax
-        local_maxima = peak_local_max(elevation, min_distance=10, num_peaks=markers_count, exclude_border=False)
-        markers = np.zeros_like(gray_image, dtype=int)
+        markers_count = int(parameters.get("markers", 250))
+        strategy = parameters.get("marker_strategy", "local_maxima")
+        min_distance = int(parameters.get("min_distance", 10))
         
-        # Use correct indexing to assign markers
-        for i, coords in enumerate(local_maxima):
-            markers[tuple(coords)] = i + 1
+        seeds = self.get_seeds(image_features, strategy, markers_count, min_distance)
+        markers = place_markers(elevation.shape, seeds)
         
         # Apply watershed
         labels = watershed(
@@ -70,15 +126,27 @@ class WatershedAlgorithm(BaseSegmentationAlgorithm):
         
         # Calculate metrics
         processing_time = time.time() - start_time
-        memory_after = process.memory_info().rss / 1024 / 1024
-        memory_usage = memory_after - memory_before
-        segments_count = len(np.unique(labels))
         
         metrics = SegmentationMetrics(
-            segments_count=segments_count,
             processing_time=processing_time,
-            memory_usage=memory_usage,
             parameters_used=parameters
         )
         
-        return labels, metrics
\ No newline at end of file
+        return labels, metrics
+
+    def get_seeds(self, features: ImageFeatures, strategy: str, count: int, min_distance: int) -> np.ndarray:
+        """(count, 2) seed coordinates for a marker strategy."""
+        if strategy == "grid":
+            return _grid_seeds(features.shape, count)
+        if strategy == "local_maxima":
+            find_seeds = _local_maxima_seeds
+        elif strategy == "distance_transform":
+            find_seeds = _distance_transform_seeds
+        else:
+            raise ValueError(f"Unknown marker strategy: {strategy}")
+
+        ranked = features.get_or_compute(
+            ("watershed", strategy, min_distance),
+            lambda: find_seeds(features.elevation, min_distance)
+        )
+        return ranked[:count]
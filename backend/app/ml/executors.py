@@ -0,0 +1,385 @@
+# app/ml/executors.py
+import asyncio
+import multiprocessing
+import os
+import zlib
+from abc import ABC, abstractmethod
+from concurrent.futures import BrokenExecutor, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import structlog
+
+from app.config import settings
+from app.ml.algorithms import ALGORITHM_REGISTRY, SegmentationMetrics, get_algorithm, get_algorithm_class
+from app.ml.metrics import segment_sizes, summarize_segment_sizes
+from app.ml.preprocessing import get_feature_cache
+from app.ml.shared_memory import (
+    SharedArrayHandle, attach_shared_array, close_shared_image_store, get_shared_image_store,
+    take_shared_array, write_shared_array
+)
+from app.utils.performance import MemoryProfiler, mark_single_job_process
+
+logger = structlog.get_logger()
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def warm_up_worker() -> int:
+    """Import every algorithm and its libraries so the first real job pays no startup cost."""
+    for algorithm_name in ALGORITHM_REGISTRY:
+        get_algorithm(algorithm_name).warm_up()
+    return os.getpid()
+
+
+def init_worker_process() -> int:
+    """Process pool initializer: each worker runs one job at a time, so it profiles memory."""
+    mark_single_job_process()
+    return warm_up_worker()
+
+
+def record_memory(metrics: SegmentationMetrics, profiler: MemoryProfiler) -> None:
+    """Store a profiler's stages and totals in segmentation metrics."""
+    if profiler.stages:
+        metrics.memory_stages = dict(profiler.stages)
+        metrics.memory_usage = profiler.peak
+        metrics.memory_net = profiler.net
+
+
+def run_segmentation(
+    algorithm_name: str,
+    image: Union[np.ndarray, SharedArrayHandle],
+    parameters: Dict[str, Any],
+    image_key: Optional[str] = None,
+    result_path: Optional[str] = None,
+    warm_start: Optional[Dict[str, Any]] = None
+) -> Tuple[Union[np.ndarray, SharedArrayHandle], SegmentationMetrics]:
+    """Run a single algorithm. Module-level so it can be pickled into worker processes.
+
+    When ``image`` is a SharedArrayHandle the pixels are mapped instead of unpickled;
+    when ``result_path`` is given the labels are returned through shared memory too.
+    With an ``image_key`` derived features come from this process's feature cache.
+    ``warm_start`` is forwarded to algorithms that support it. Memory is measured
+    per stage (see MemoryProfiler) and reported in the metrics.
+    """
+    if isinstance(image, SharedArrayHandle):
+        image = attach_shared_array(image)
+    features = get_feature_cache().get(image_key, image) if image_key is not None else None
+    algorithm = get_algorithm(algorithm_name)
+    profiler = MemoryProfiler()
+    with profiler.stage("segment"):
+        if warm_start is not None and algorithm.supports_warm_start:
+            labels, metrics = algorithm.segment(image, parameters, features=features, warm_start=warm_start)
+        else:
+            labels, metrics = algorithm.segment(image, parameters, features=features)
+    with profiler.stage("statistics"):
+        # One bincount gives both the count and the size summary; per-segment geometry
+        # is only computed on request (SegmentationService.get_result_segments)
+        area = segment_sizes(labels)
+        metrics.segments_count = len(area)
+        metrics.segment_stats = summarize_segment_sizes(area, int(labels.size))
+    record_memory(metrics, profiler)
+    if result_path is not None:
+        try:
+            return write_shared_array(labels, result_path), metrics
+        except OSError:
+            # Shared memory full: fall back to pickling the labels
+            pass
+    return labels, metrics
+
+
+def default_worker_count() -> int:
+    if settings.SEGMENTATION_WORKERS > 0:
+        return settings.SEGMENTATION_WORKERS
+    return max(1, min(settings.MAX_CONCURRENT_SEGMENTATIONS, os.cpu_count() or 1))
+
+
+class SegmentationExecutor(ABC):
+    """Runs BaseSegmentationAlgorithm.segment somewhere other than the event loop."""
+
+    kind: str = ""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+
+    @abstractmethod
+    def start(self) -> None:
+        """Create (and warm up) the underlying pool."""
+        pass
+
+    @abstractmethod
+    def shutdown(self) -> None:
+        """Release the underlying pool."""
+        pass
+
+    @abstractmethod
+    async def run(
+        self,
+        algorithm_name: str,
+        image: np.ndarray,
+        parameters: Dict[str, Any],
+        image_key: Optional[str] = None,
+        warm_start: Optional[Dict[str, Any]] = None
+    ) -> Tuple[np.ndarray, SegmentationMetrics]:
+        """Segment an image and return (labels, metrics).
+
+        ``image_key`` identifies the image (e.g. its image_id) so executors can share it;
+        ``warm_start`` is the state of a previous run (see SegmentationMetrics.state).
+        """
+        pass
+
+    def info(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "max_workers": self.max_workers}
+
+
+class _PoolExecutor(SegmentationExecutor):
+    """Shared implementation for concurrent.futures based executors.
+
+    Jobs may carry an affinity; with several pools, jobs with the same affinity
+    always land on the same pool so per-process caches stay warm.
+    """
+
+    def __init__(self, max_workers: int):
+        super().__init__(max_workers)
+        self._pools: List[Executor] = []
+        self._pending: List[int] = []
+
+    @abstractmethod
+    def _create_pools(self) -> List[Executor]:
+        pass
+
+    def _ensure_pools(self) -> List[Executor]:
+        if not self._pools:
+            self._pools = self._create_pools()
+            self._pending = [0] * len(self._pools)
+        return self._pools
+
+    def _select_pool(self, affinity: Optional[int]) -> int:
+        if affinity is not None:
+            return affinity % len(self._pools)
+        return min(range(len(self._pools)), key=self._pending.__getitem__)
+
+    def start(self) -> None:
+        if self._pools:
+            return
+        pools = self._ensure_pools()
+        workers_per_pool = max(1, self.max_workers // len(pools))
+        # Force every worker to exist and import the algorithms now rather than on first request
+        futures = [pool.submit(warm_up_worker) for pool in pools for _ in range(workers_per_pool)]
+        workers = {future.result() for future in futures}
+        logger.info("Segmentation executor started", kind=self.kind, max_workers=self.max_workers, warmed=len(workers))
+
+    def shutdown(self) -> None:
+        if self._pools:
+            for pool in self._pools:
+                pool.shutdown(wait=False, cancel_futures=True)
+            self._pools = []
+            self._pending = []
+            logger.info("Segmentation executor stopped", kind=self.kind)
+
+    async def run(
+        self,
+        algorithm_name: str,
+        image: np.ndarray,
+        parameters: Dict[str, Any],
+        image_key: Optional[str] = None,
+        warm_start: Optional[Dict[str, Any]] = None
+    ) -> Tuple[np.ndarray, SegmentationMetrics]:
+        return await self._submit((algorithm_name, image, parameters, image_key, None, warm_start))
+
+    async def _submit(
+        self,
+        args: Tuple[Any, ...],
+        affinity: Optional[int] = None,
+        on_abandon: Optional[Callable[[Future], None]] = None
+    ) -> Any:
+        """Run a job on a pool; ``on_abandon`` gets the job's future if its result is never returned."""
+        pools = self._ensure_pools()
+        index = self._select_pool(affinity)
+        self._pending[index] += 1
+        future = pools[index].submit(run_segmentation, *args)
+        try:
+            return await asyncio.wrap_future(future)
+        except BrokenExecutor:
+            # A worker died (e.g. OOM kill); drop the pools so the next job gets fresh ones
+            logger.error("Segmentation executor broken, restarting", kind=self.kind)
+            self.shutdown()
+            raise
+        except BaseException:
+            # Failed, timed out or cancelled; a running worker keeps going regardless
+            if on_abandon is not None:
+                on_abandon(future)
+            raise
+        finally:
+            if index < len(self._pending):
+                self._pending[index] -= 1
+
+    def info(self) -> Dict[str, Any]:
+        return {**super().info(), "pools": len(self._pools), "pending": list(self._pending)}
+
+
+class ProcessPoolSegmentationExecutor(_PoolExecutor):
+    """Long-lived worker processes; true parallelism for GIL-bound algorithms.
+
+    With SEGMENTATION_WORKER_AFFINITY each worker is its own single-process pool and
+    jobs are routed by (image, algorithm), so repeated slider updates for one image
+    hit the same worker's feature cache while different algorithms still spread
+    across workers.
+    """
+
+    kind = "process"
+
+    def _create_pools(self) -> List[Executor]:
+        context = multiprocessing.get_context(settings.SEGMENTATION_MP_START_METHOD)
+        if settings.SEGMENTATION_WORKER_AFFINITY:
+            return [
+                ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=init_worker_process)
+                for _ in range(self.max_workers)
+            ]
+        return [ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context, initializer=init_worker_process)]
+
+    @staticmethod
+    def _affinity(algorithm_name: str, image_key: Optional[str]) -> Optional[int]:
+        if image_key is None:
+            return None
+        algorithm_index = list(ALGORITHM_REGISTRY).index(algorithm_name) if algorithm_name in ALGORITHM_REGISTRY else 0
+        return zlib.crc32(image_key.encode()) + algorithm_index
+
+    async def run(
+        self,
+        algorithm_name: str,
+        image: np.ndarray,
+        parameters: Dict[str, Any],
+        image_key: Optional[str] = None,
+        warm_start: Optional[Dict[str, Any]] = None
+    ) -> Tuple[np.ndarray, SegmentationMetrics]:
+        affinity = self._affinity(algorithm_name, image_key)
+        if not settings.ENABLE_SHARED_MEMORY or image_key is None:
+            return await self._submit((algorithm_name, image, parameters, image_key, None, warm_start), affinity)
+
+        store = get_shared_image_store()
+        try:
+            handle = await asyncio.to_thread(store.acquire, image_key, image)
+        except OSError as e:
+            logger.warning("Shared memory unavailable, pickling image", image_key=image_key, error=str(e))
+            return await self._submit((algorithm_name, image, parameters, image_key, None, warm_start), affinity)
+
+        result_path = store.new_result_path()
+        try:
+            labels, metrics = await self._submit(
+                (algorithm_name, handle, parameters, image_key, result_path, warm_start),
+                affinity,
+                on_abandon=lambda future: future.add_done_callback(lambda _: _unlink(result_path))
+            )
+        finally:
+            store.release(image_key)
+        if isinstance(labels, SharedArrayHandle):
+            labels = take_shared_array(labels)
+        return labels, metrics
+
+    def info(self) -> Dict[str, Any]:
+        info = super().info()
+        if settings.ENABLE_SHARED_MEMORY:
+            info["shared_memory"] = get_shared_image_store().stats()
+        return info
+
+
+class ThreadPoolSegmentationExecutor(_PoolExecutor):
+    """Thread pool for algorithms whose heavy loops release the GIL."""
+
+    kind = "thread"
+
+    def _create_pools(self) -> List[Executor]:
+        return [ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="segmentation")]
+
+    def info(self) -> Dict[str, Any]:
+        return {**super().info(), "feature_cache": get_feature_cache().stats()}
+
+
+class InlineSegmentationExecutor(SegmentationExecutor):
+    """Runs on the event loop itself. Only intended for debugging."""
+
+    kind = "inline"
+
+    def start(self) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        pass
+
+    async def run(
+        self,
+        algorithm_name: str,
+        image: np.ndarray,
+        parameters: Dict[str, Any],
+        image_key: Optional[str] = None,
+        warm_start: Optional[Dict[str, Any]] = None
+    ) -> Tuple[np.ndarray, SegmentationMetrics]:
+        return run_segmentation(algorithm_name, image, parameters, image_key, warm_start=warm_start)
+
+
+EXECUTOR_CLASSES = {
+    "process": ProcessPoolSegmentationExecutor,
+    "thread": ThreadPoolSegmentationExecutor,
+    "inline": InlineSegmentationExecutor
+}
+
+# Executors shared by the whole application process
+_executors: Dict[str, SegmentationExecutor] = {}
+
+
+def get_executor(kind: str) -> SegmentationExecutor:
+    """Get (creating lazily) the executor of the given kind."""
+    if kind not in EXECUTOR_CLASSES:
+        raise ValueError(f"Unknown executor: {kind}")
+    executor = _executors.get(kind)
+    if executor is None:
+        executor = EXECUTOR_CLASSES[kind](default_worker_count())
+        _executors[kind] = executor
+    return executor
+
+
+def get_executor_kind(algorithm_name: str) -> str:
+    """Resolve the executor for an algorithm: settings override, then class preference, then default."""
+    kind = settings.SEGMENTATION_EXECUTOR_OVERRIDES.get(algorithm_name)
+    if kind is None:
+        kind = get_algorithm_class(algorithm_name).preferred_executor or settings.SEGMENTATION_EXECUTOR
+    return kind
+
+
+def get_algorithm_executor(algorithm_name: str) -> SegmentationExecutor:
+    """Get the executor an algorithm should run on."""
+    return get_executor(get_executor_kind(algorithm_name))
+
+
+async def init_executors():
+    """Create and pre-warm every executor used by a registered algorithm."""
+    kinds = {get_executor_kind(name) for name in ALGORITHM_REGISTRY}
+    for kind in sorted(kinds):
+        executor = get_executor(kind)
+        try:
+            # Warm-up blocks until workers have imported the algorithms; keep it off the loop
+            await asyncio.to_thread(executor.start)
+        except Exception as e:
+            logger.error("Failed to start segmentation executor", kind=kind, error=str(e))
+
+
+async def shutdown_executors():
+    """Shut down all executors."""
+    for executor in list(_executors.values()):
+        executor.shutdown()
+    _executors.clear()
+    close_shared_image_store()
+
+
+def get_executors() -> Dict[str, SegmentationExecutor]:
+    """The executors created so far, by kind."""
+    return dict(_executors)
+
+
+def get_executors_info() -> Dict[str, Dict[str, Any]]:
+    return {kind: executor.info() for kind, executor in _executors.items()}
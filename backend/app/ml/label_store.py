@@ -0,0 +1,101 @@
+# app/ml/label_store.py
+import os
+import re
+import zipfile
+from typing import Optional
+
+import numpy as np
+
+from app.config import settings
+
+# Result ids become file names; keep them to a safe alphabet
+_RESULT_ID = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def label_dtype(max_label: int) -> np.dtype:
+    """Smallest unsigned dtype that holds labels 0..max_label."""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_label <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    raise ValueError(f"Too many labels to store: {max_label}")
+
+
+class LabelStore:
+    """Label maps of segmentation results, stored next to their rendered images.
+
+    Labels are narrowed to uint8/uint16/uint32 by their largest value. By default
+    they are written as plain .npy files that load memory-mapped, so re-rendering
+    or reading statistics of a huge result only touches the pages it needs. With
+    LABEL_STORE_COMPRESSION they are written as deflate-compressed .npz instead
+    (several times smaller on disk, but loading decompresses the whole map).
+    """
+
+    def __init__(self, path: Optional[str] = None, compress: Optional[bool] = None):
+        self.path = path or settings.UPLOAD_PATH
+        self.compress = settings.LABEL_STORE_COMPRESSION if compress is None else compress
+        os.makedirs(self.path, exist_ok=True)
+
+    def filename(self, result_id: str, compressed: Optional[bool] = None) -> str:
+        if not _RESULT_ID.match(result_id):
+            raise ValueError(f"Invalid result id: {result_id}")
+        compressed = self.compress if compressed is None else compressed
+        return f"{result_id}_labels.{'npz' if compressed else 'npy'}"
+
+    def save(self, result_id: str, labels: np.ndarray) -> str:
+        """Store a label map; returns its file name."""
+        max_label = int(labels.max()) if labels.size else 0
+        if labels.size and int(labels.min()) < 0:
+            raise ValueError("Label maps must not contain negative labels")
+        compact = labels.astype(label_dtype(max_label), copy=False)
+
+        filename = self.filename(result_id)
+        path = os.path.join(self.path, filename)
+        tmp_path = f"{path}.tmp"
+        if self.compress:
+            with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+                with archive.open("labels.npy", "w", force_zip64=True) as member:
+                    np.lib.format.write_array(member, compact, allow_pickle=False)
+        else:
+            with open(tmp_path, "wb") as f:
+                np.lib.format.write_array(f, compact, allow_pickle=False)
+        # Readers must never observe a partially written file
+        os.replace(tmp_path, path)
+        return filename
+
+    def locate(self, result_id: str) -> Optional[str]:
+        """Path of a stored label map in either format, if it exists."""
+        for compressed in (self.compress, not self.compress):
+            path = os.path.join(self.path, self.filename(result_id, compressed))
+            if os.path.exists(path):
+                return path
+        return None
+
+    def load(self, result_id: str) -> Optional[np.ndarray]:
+        """Load a label map (memory-mapped and read-only when stored uncompressed)."""
+        path = self.locate(result_id)
+        if path is None:
+            return None
+        if path.endswith(".npz"):
+            with np.load(path, allow_pickle=False) as archive:
+                labels = archive["labels"]
+            labels.flags.writeable = False
+            return labels
+        return np.load(path, mmap_mode="r", allow_pickle=False)
+
+    def delete(self, result_id: str) -> None:
+        for compressed in (False, True):
+            try:
+                os.unlink(os.path.join(self.path, self.filename(result_id, compressed)))
+            except FileNotFoundError:
+                pass
+
+
+_store: Optional[LabelStore] = None
+
+
+def get_label_store() -> LabelStore:
+    """Get the process-wide label store."""
+    global _store
+    if _store is None:
+        _store = LabelStore()
+    return _store
@@ -0,0 +1,132 @@
+# app/ml/metrics.py
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def _offset_labels(labels: np.ndarray) -> Tuple[np.ndarray, int]:
+    """Flat non-negative labels for bincount, plus the offset that was subtracted."""
+    flat = labels.ravel()
+    offset = int(flat.min()) if flat.size else 0
+    if offset < 0:
+        flat = flat - offset
+    else:
+        offset = 0
+    return flat, offset
+
+
+def segment_sizes(labels: np.ndarray) -> np.ndarray:
+    """Pixel count of every present label, in label order, from a single bincount."""
+    if labels.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    flat, _ = _offset_labels(labels)
+    counts = np.bincount(flat)
+    return counts[counts > 0]
+
+
+def count_segments(labels: np.ndarray) -> int:
+    """Number of distinct labels, in O(pixels + max label) without sorting."""
+    return len(segment_sizes(labels))
+
+
+def summarize_segment_sizes(area: np.ndarray, total_pixels: int) -> Dict[str, Any]:
+    """Aggregate segment size statistics from per-segment pixel counts."""
+    count = len(area)
+    return {
+        "num_segments": count,
+        "min_segment_size": int(area.min()) if count else 0,
+        "max_segment_size": int(area.max()) if count else 0,
+        "mean_segment_size": float(area.mean()) if count else 0.0,
+        "std_segment_size": float(area.std()) if count else 0.0,
+        "total_pixels": total_pixels
+    }
+
+
+@dataclass
+class RegionStatistics:
+    """Per-segment statistics; row i describes segment ``label_ids[i]``."""
+    label_ids: np.ndarray  # (K,)
+    area: np.ndarray  # (K,) pixels
+    centroid: np.ndarray  # (K, 2) row, col
+    bbox: np.ndarray  # (K, 4) min_row, min_col, max_row, max_col (exclusive)
+    mean_color: Optional[np.ndarray] = None  # (K, C), in the image's value range
+    total_pixels: int = 0
+
+    @property
+    def count(self) -> int:
+        return len(self.label_ids)
+
+    def summary(self) -> Dict[str, Any]:
+        """Aggregate segment size statistics."""
+        return summarize_segment_sizes(self.area, self.total_pixels)
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """One JSON-friendly dict per segment."""
+        records = []
+        for i, label_id in enumerate(self.label_ids.tolist()):
+            record = {
+                "label": label_id,
+                "area": int(self.area[i]),
+                "centroid": self.centroid[i].tolist(),
+                "bbox": self.bbox[i].tolist()
+            }
+            if self.mean_color is not None:
+                record["mean_color"] = self.mean_color[i].tolist()
+            records.append(record)
+        return records
+
+
+def compute_region_statistics(labels: np.ndarray, image: Optional[np.ndarray] = None) -> RegionStatistics:
+    """Area, centroid, bounding box and (with ``image``) mean color of every segment.
+
+    Each statistic is one bincount or find_objects pass over the pixels, regardless
+    of the number of segments.
+    """
+    from scipy import ndimage as ndi
+    
+    if labels.ndim != 2:
+        raise ValueError(f"Expected a 2D label map, got shape {labels.shape}")
+    height, width = labels.shape
+    if labels.size == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return RegionStatistics(empty, empty, np.zeros((0, 2)), np.zeros((0, 4), dtype=np.int64))
+
+    flat, offset = _offset_labels(labels)
+    counts = np.bincount(flat)
+    present = np.flatnonzero(counts)
+    area = counts[present]
+    bins = len(counts)
+
+    # Row/col sums per label; coordinates repeat per row/col, so weight by broadcast views
+    rows = np.broadcast_to(np.arange(height, dtype=np.float64)[:, None], labels.shape).ravel()
+    cols = np.broadcast_to(np.arange(width, dtype=np.float64)[None, :], labels.shape).ravel()
+    centroid = np.stack([
+        np.bincount(flat, weights=rows, minlength=bins)[present],
+        np.bincount(flat, weights=cols, minlength=bins)[present]
+    ], axis=1) / area[:, None]
+
+    # find_objects ignores label 0, so shift labels to start at 1
+    shifted = flat.reshape(labels.shape) + 1
+    slices = ndi.find_objects(shifted)
+    bbox = np.array(
+        [(s[0].start, s[1].start, s[0].stop, s[1].stop) for s in (slices[i] for i in present)],
+        dtype=np.int64
+    )
+
+    mean_color = None
+    if image is not None:
+        channels = image.reshape(labels.size, -1)
+        mean_color = np.stack([
+            np.bincount(flat, weights=channels[:, c], minlength=bins)[present]
+            for c in range(channels.shape[1])
+        ], axis=1) / area[:, None]
+
+    return RegionStatistics(
+        label_ids=present + offset,
+        area=area,
+        centroid=centroid,
+        bbox=bbox,
+        mean_color=mean_color,
+        total_pixels=int(labels.size)
+    )
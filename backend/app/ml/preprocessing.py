@@ -0,0 +1,197 @@
+# app/ml/preprocessing.py
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.utils.cache import LRUCache, nested_nbytes
+
+
+def normalize_image(image: np.ndarray) -> np.ndarray:
+    """Convert to float32 in [0, 1] (same rule as BaseSegmentationAlgorithm.preprocess_image)."""
+    if image.dtype == np.uint8:
+        return image.astype(np.float32) / 255.0
+    return image
+
+
+class ImageFeatures:
+    """Lazily computed, read-only representations of one image.
+
+    Each representation is computed at most once and shared by every algorithm
+    that asks for it. Arrays are marked read-only so they can be handed to
+    concurrent jobs safely.
+    """
+
+    def __init__(self, image: np.ndarray, on_grow: Optional[Callable[["ImageFeatures"], None]] = None):
+        self.image = image
+        self.shape = image.shape
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._on_grow = on_grow
+
+    def get_or_compute(self, name: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return a cached representation, computing it on first use."""
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                return self._entries[name]
+            value = compute()
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+            self._entries[name] = value
+        if self._on_grow:
+            self._on_grow(self)
+        return value
+
+    @property
+    def normalized(self) -> np.ndarray:
+        """float32 image in [0, 1]."""
+        def compute():
+            normalized = normalize_image(self.image)
+            # Never mark the caller's own array read-only
+            return normalized.copy() if normalized is self.image else normalized
+        return self.get_or_compute("normalized", compute)
+
+    @property
+    def gray(self) -> np.ndarray:
+        """Grayscale as the channel mean of the normalized image."""
+        def compute():
+            normalized = self.normalized
+            return np.mean(normalized, axis=2) if normalized.ndim == 3 else normalized
+        return self.get_or_compute("gray", compute)
+
+    @property
+    def elevation(self) -> np.ndarray:
+        """Sobel edge magnitude of the grayscale image."""
+        def compute():
+            from skimage.filters import sobel
+            return sobel(self.gray)
+        return self.get_or_compute("elevation", compute)
+
+    @property
+    def lab(self) -> np.ndarray:
+        """CIE Lab conversion of the normalized image."""
+        def compute():
+            from skimage.color import rgb2lab
+            return rgb2lab(self.normalized)
+        return self.get_or_compute("lab", compute)
+
+    def smoothed(self, sigma: float) -> np.ndarray:
+        """Normalized image Gaussian-smoothed over the spatial axes."""
+        sigma = float(sigma)
+        if sigma <= 0:
+            return self.normalized
+
+        def compute():
+            from scipy import ndimage as ndi
+            normalized = self.normalized
+            spatial_sigma = [sigma, sigma] + [0] * (normalized.ndim - 2)
+            return ndi.gaussian_filter(normalized, sigma=spatial_sigma)
+        return self.get_or_compute(("smoothed", sigma), compute)
+
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(nested_nbytes(value) for value in self._entries.values())
+
+    def trim(self, max_bytes: int) -> None:
+        """Drop least recently used representations until within max_bytes (keeps the newest)."""
+        with self._lock:
+            while len(self._entries) > 1 and self.nbytes > max_bytes:
+                self._entries.popitem(last=False)
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+
+class FeatureCache:
+    """Per-process cache of ImageFeatures keyed by image, bounded by a byte budget."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = LRUCache(max_bytes=max_bytes, sizeof=lambda features: features.nbytes)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, image: np.ndarray) -> ImageFeatures:
+        """Get the features for an image, creating an empty (lazy) entry on first use."""
+        with self._lock:
+            features = self._entries.get(key)
+            if features is None or features.shape != image.shape:
+                features = ImageFeatures(image, on_grow=lambda grown: self._on_grow(key, grown))
+                self._entries.put(key, features, size=0)
+            else:
+                features.image = image
+            return features
+
+    def _on_grow(self, key: Hashable, features: ImageFeatures) -> None:
+        if self._entries.peek(key) is not features:
+            return
+        # Evict other images first; only then trim this image's own older representations
+        self._entries.resize(key, features.nbytes)
+        if features.nbytes > self.max_bytes:
+            features.trim(self.max_bytes)
+            self._entries.resize(key, features.nbytes)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._entries.pop(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return self._entries.stats()
+
+
+def pyramid_level_for(shape: Tuple[int, ...], max_dimension: int) -> int:
+    """Smallest pyramid level (each halves both sides) whose larger side fits max_dimension."""
+    level = 0
+    while max(shape[:2]) > max_dimension << level:
+        level += 1
+    return level
+
+
+def downscale_image(image: np.ndarray, level: int) -> np.ndarray:
+    """Pyramid level of an image: 2**level x 2**level block means, same dtype."""
+    factor = 1 << level
+    if factor == 1:
+        return image
+    height, width = image.shape[0] // factor, image.shape[1] // factor
+    blocks = image[:height * factor, :width * factor].reshape(
+        height, factor, width, factor, *image.shape[2:]
+    )
+    downscaled = blocks.mean(axis=(1, 3), dtype=np.float32)
+    if np.issubdtype(image.dtype, np.integer):
+        downscaled = np.rint(downscaled)
+    return downscaled.astype(image.dtype)
+
+
+_pyramid_cache: Optional[LRUCache] = None
+
+
+def get_pyramid_level(key: Hashable, image: np.ndarray, level: int) -> np.ndarray:
+    """Downscaled image for a pyramid level, cached per (image key, level)."""
+    global _pyramid_cache
+    if level == 0:
+        return image
+    if _pyramid_cache is None:
+        _pyramid_cache = LRUCache(max_bytes=settings.PYRAMID_CACHE_MAX_BYTES)
+    downscaled = _pyramid_cache.get((key, level))
+    if downscaled is None or downscaled.shape[:2] != (image.shape[0] >> level, image.shape[1] >> level):
+        downscaled = downscale_image(image, level)
+        downscaled.flags.writeable = False
+        _pyramid_cache.put((key, level), downscaled)
+    return downscaled
+
+
+_feature_cache: Optional[FeatureCache] = None
+
+
+def get_feature_cache() -> FeatureCache:
+    """Get the feature cache of the current process (API process or worker)."""
+    global _feature_cache
+    if _feature_cache is None:
+        _feature_cache = FeatureCache(settings.FEATURE_CACHE_MAX_BYTES)
+    return _feature_cache
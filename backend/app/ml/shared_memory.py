@@ -0,0 +1,186 @@
+# app/ml/shared_memory.py
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import psutil
+
+from app.config import settings
+from app.utils.cache import LRUCache
+
+
+@dataclass(frozen=True)
+class SharedArrayHandle:
+    """Picklable reference to an array stored in a memory-mapped .npy file.
+
+    Only the path and layout cross the process boundary; both sides map the
+    same pages (tmpfs under /dev/shm by default), so the pixels are never pickled.
+    """
+    path: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+    @property
+    def nbytes(self) -> int:
+        return int(np.prod(self.shape)) * np.dtype(self.dtype).itemsize
+
+
+def write_shared_array(array: np.ndarray, path: str) -> SharedArrayHandle:
+    """Copy an array into a new memory-mapped file."""
+    tmp_path = f"{path}.tmp"
+    mapped = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=array.dtype, shape=array.shape)
+    try:
+        mapped[...] = array
+        mapped.flush()
+    finally:
+        del mapped
+    # Readers must never observe a partially written file
+    os.replace(tmp_path, path)
+    return SharedArrayHandle(path=path, shape=tuple(array.shape), dtype=array.dtype.str)
+
+
+def attach_shared_array(handle: SharedArrayHandle) -> np.ndarray:
+    """Map a shared array read-only, without copying."""
+    mapped = np.load(handle.path, mmap_mode="r")
+    return mapped.view(np.ndarray)
+
+
+def take_shared_array(handle: SharedArrayHandle) -> np.ndarray:
+    """Map a single-use shared array and unlink its file.
+
+    The mapping stays valid after the unlink; pages are freed once the array is collected.
+    """
+    try:
+        return attach_shared_array(handle)
+    finally:
+        try:
+            os.unlink(handle.path)
+        except FileNotFoundError:
+            pass
+
+
+def _default_base_path() -> str:
+    base = settings.SHARED_MEMORY_PATH
+    parent = os.path.dirname(base.rstrip("/")) or "/"
+    if not os.path.isdir(parent):
+        base = os.path.join(tempfile.gettempdir(), "segmentation-shm")
+    return base
+
+
+class SharedImageStore:
+    """Images shared with segmentation workers, keyed by image_id.
+
+    Each API process owns a private directory (named by PID) so multiple uvicorn
+    workers never collide. Entries are LRU-evicted by a byte budget; an entry in
+    use by a running job is pinned and only unlinked once released.
+    """
+
+    def __init__(self, base_path: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.base_path = base_path or _default_base_path()
+        self.path = os.path.join(self.base_path, str(os.getpid()))
+        self._entries = LRUCache(
+            max_bytes=max_bytes if max_bytes is not None else settings.SHARED_MEMORY_MAX_BYTES,
+            sizeof=lambda handle: handle.nbytes,
+            on_evict=self._on_evict
+        )
+        self._pins: Dict[str, int] = {}
+        self._evicted_while_pinned: Dict[str, List[SharedArrayHandle]] = {}
+        self._lock = threading.RLock()
+        self.bytes_written = 0
+        os.makedirs(self.path, exist_ok=True)
+        self._remove_stale_directories()
+
+    def _remove_stale_directories(self) -> None:
+        """Remove directories left behind by API processes that no longer exist."""
+        for name in os.listdir(self.base_path):
+            if name.isdigit() and int(name) != os.getpid() and not psutil.pid_exists(int(name)):
+                shutil.rmtree(os.path.join(self.base_path, name), ignore_errors=True)
+
+    def _on_evict(self, image_id: str, handle: SharedArrayHandle) -> None:
+        with self._lock:
+            if self._pins.get(image_id):
+                self._evicted_while_pinned.setdefault(image_id, []).append(handle)
+                return
+        self._unlink(handle)
+
+    @staticmethod
+    def _unlink(handle: SharedArrayHandle) -> None:
+        try:
+            os.unlink(handle.path)
+        except FileNotFoundError:
+            pass
+
+    def acquire(self, image_id: str, image: np.ndarray) -> SharedArrayHandle:
+        """Get a pinned handle for an image, writing it to shared memory on first use."""
+        with self._lock:
+            handle = self._entries.get(image_id)
+            if handle is not None and (handle.shape != image.shape or handle.dtype != image.dtype.str):
+                self._entries.pop(image_id)
+                self._on_evict(image_id, handle)
+                handle = None
+            self._pins[image_id] = self._pins.get(image_id, 0) + 1
+            if handle is None:
+                try:
+                    handle = write_shared_array(image, os.path.join(self.path, f"image-{uuid.uuid4().hex}.npy"))
+                except Exception:
+                    self._pins[image_id] -= 1
+                    raise
+                self.bytes_written += handle.nbytes
+                if not self._entries.put(image_id, handle):
+                    # Larger than the whole budget: use once, then drop
+                    self._evicted_while_pinned.setdefault(image_id, []).append(handle)
+            return handle
+
+    def release(self, image_id: str) -> None:
+        """Unpin an image; unlink its files if they were evicted while in use."""
+        with self._lock:
+            remaining = self._pins.get(image_id, 0) - 1
+            if remaining > 0:
+                self._pins[image_id] = remaining
+                return
+            self._pins.pop(image_id, None)
+            handles = self._evicted_while_pinned.pop(image_id, [])
+        for handle in handles:
+            self._unlink(handle)
+
+    def invalidate(self, image_id: str) -> None:
+        """Drop an image from the store (e.g. after it was deleted)."""
+        handle = self._entries.pop(image_id)
+        if handle is not None:
+            self._on_evict(image_id, handle)
+
+    def new_result_path(self) -> str:
+        """Path for a single-use result array written by a worker."""
+        return os.path.join(self.path, f"result-{uuid.uuid4().hex}.npy")
+
+    def close(self) -> None:
+        """Remove every shared file owned by this process."""
+        self._entries.clear()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._entries.stats(), "path": self.path, "bytes_written": self.bytes_written}
+
+
+_store: Optional[SharedImageStore] = None
+
+
+def get_shared_image_store() -> SharedImageStore:
+    """Get the process-wide shared image store."""
+    global _store
+    if _store is None:
+        _store = SharedImageStore()
+    return _store
+
+
+def close_shared_image_store() -> None:
+    """Remove all shared memory files owned by this process."""
+    global _store
+    if _store is not None:
+        _store.close()
+        _store = None
@@ -0,0 +1,268 @@
+# app/ml/tiling.py
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import structlog
+
+from app.config import settings
+from app.ml.algorithms import SegmentationMetrics, get_algorithm
+from app.ml.executors import record_memory
+from app.ml.metrics import summarize_segment_sizes
+from app.utils.performance import MemoryProfiler
+
+logger = structlog.get_logger()
+
+Window = Tuple[slice, slice]
+
+
+@dataclass(frozen=True)
+class Tile:
+    """One tile of a tiled segmentation.
+
+    The algorithm runs on ``window`` (the tile plus its overlap with the neighbors);
+    the tile owns only ``core`` in the stitched label map.
+    """
+    index: int
+    row: int
+    col: int
+    window: Window
+    core: Window
+
+    @property
+    def core_in_window(self) -> Window:
+        return tuple(
+            slice(core.start - window.start, core.stop - window.start)
+            for core, window in zip(self.core, self.window)
+        )
+
+    @property
+    def area(self) -> int:
+        return (self.window[0].stop - self.window[0].start) * (self.window[1].stop - self.window[1].start)
+
+
+def should_tile(shape: Tuple[int, ...]) -> bool:
+    """Whether an image is large enough to be segmented tile by tile."""
+    return settings.ENABLE_TILED_SEGMENTATION and max(shape[:2]) > settings.TILED_SEGMENTATION_THRESHOLD
+
+
+def plan_tiles(shape: Tuple[int, ...], tile_size: int, overlap: int) -> List[Tile]:
+    """Split an image into a grid of evenly sized tiles of at most ``tile_size`` pixels a side."""
+    height, width = shape[:2]
+    row_edges = np.linspace(0, height, -(-height // tile_size) + 1).round().astype(int)
+    col_edges = np.linspace(0, width, -(-width // tile_size) + 1).round().astype(int)
+    tiles = []
+    for row, (y0, y1) in enumerate(zip(row_edges[:-1], row_edges[1:])):
+        for col, (x0, x1) in enumerate(zip(col_edges[:-1], col_edges[1:])):
+            tiles.append(Tile(
+                index=len(tiles),
+                row=row,
+                col=col,
+                window=(slice(max(0, y0 - overlap), min(height, y1 + overlap)),
+                        slice(max(0, x0 - overlap), min(width, x1 + overlap))),
+                core=(slice(int(y0), int(y1)), slice(int(x0), int(x1)))
+            ))
+    return tiles
+
+
+def _intersection(a: Window, b: Window) -> Optional[Window]:
+    window = tuple(slice(max(x.start, y.start), min(x.stop, y.stop)) for x, y in zip(a, b))
+    if any(s.start >= s.stop for s in window):
+        return None
+    return window
+
+
+def _relative(window: Window, origin: Window) -> Window:
+    return tuple(slice(s.start - o.start, s.stop - o.start) for s, o in zip(window, origin))
+
+
+class TileStitcher:
+    """Assembles per-tile label maps into one consistently labeled map.
+
+    A tile owns the segments that lie mostly inside its core. Those keep their full
+    shape, including the part that reaches into a neighbor's core through the
+    overlap, so segments are not cut along the tile grid. Overlap pixels no tile
+    owns take the label of the upper/left tile, so a segment straddling the seam
+    stays whole there too. Segments of neighboring tiles that mostly cover the same
+    overlap pixels (intersection over union of at least ``min_agreement``) are
+    joined, which stitches segments larger than a tile.
+
+    Tiles can be added in any order; only the overlap labels of unfinished
+    neighbors are kept. finish() relabels everything to 0..N-1 one core at a time.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], tiles: List[Tile], min_agreement: float = 0.5):
+        self.tiles = tiles
+        self.min_agreement = min_agreement
+        # Global labels; pixels whose segment belongs to another tile are stored as ~label until resolved
+        self.labels = np.empty(shape[:2], dtype=np.int32)
+        self.areas: Optional[np.ndarray] = None
+        self._grid = {(tile.row, tile.col): tile for tile in tiles}
+        self._offsets: Dict[int, int] = {}
+        self._owned: Dict[int, np.ndarray] = {}
+        self._next_label = 0
+        self._overlaps: Dict[Tuple[int, int], np.ndarray] = {}
+        self._edges: List[np.ndarray] = []
+        self._lock = threading.Lock()
+
+    def _neighbors(self, tile: Tile) -> List[Tile]:
+        positions = [(tile.row - 1, tile.col), (tile.row + 1, tile.col), (tile.row, tile.col - 1), (tile.row, tile.col + 1)]
+        return [self._grid[position] for position in positions if position in self._grid]
+
+    def add(self, tile: Tile, labels: np.ndarray) -> None:
+        """Stitch in the labels of one tile (computed on ``tile.window``)."""
+        count = int(labels.max()) + 1
+        core_labels = labels[tile.core_in_window]
+        owned = np.bincount(core_labels.ravel(), minlength=count) * 2 > np.bincount(labels.ravel(), minlength=count)
+
+        with self._lock:
+            offset = self._next_label
+            self._next_label += count
+            if self._next_label > np.iinfo(np.int32).max:
+                raise ValueError("Too many segments to stitch")
+            self._offsets[tile.index] = offset
+            self._owned[tile.index] = owned
+
+            core = core_labels + np.int32(offset)
+            self.labels[tile.core] = np.where(owned[core_labels], core, ~core)
+
+            for neighbor in self._neighbors(tile):
+                overlap = _intersection(tile.window, neighbor.window)
+                if overlap is None:
+                    continue
+                mine = labels[_relative(overlap, tile.window)] + np.int32(offset)
+                theirs = self._overlaps.pop((neighbor.index, tile.index), None)
+                if theirs is None:
+                    self._overlaps[(tile.index, neighbor.index)] = mine
+                    continue
+                self._claim(tile, neighbor, overlap, theirs)
+                self._claim(neighbor, tile, overlap, mine)
+                self._edges.append(self._match(mine, theirs))
+
+    def _claim(self, tile: Tile, neighbor: Tile, overlap: Window, neighbor_labels: np.ndarray) -> None:
+        """Give unowned pixels of ``tile``'s core to ``neighbor``'s segments there.
+
+        Only owned segments claim pixels, unless ``neighbor`` is the upper/left tile.
+        """
+        region = _intersection(overlap, tile.core)
+        if region is None:
+            return
+        current = self.labels[region]
+        claims = neighbor_labels[_relative(region, overlap)]
+        take = current < 0
+        if (neighbor.row, neighbor.col) > (tile.row, tile.col):
+            take &= self._owned[neighbor.index][claims - self._offsets[neighbor.index]]
+        current[take] = claims[take]
+
+    def _match(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """Pairs of global labels that mostly cover the same pixels of an overlap."""
+        a, b = a.ravel().astype(np.int64), b.ravel().astype(np.int64)
+        pairs, pair_counts = np.unique((a << 32) | b, return_counts=True)
+        pair_a, pair_b = pairs >> 32, pairs & 0xFFFFFFFF
+        labels_a, sizes_a = np.unique(a, return_counts=True)
+        labels_b, sizes_b = np.unique(b, return_counts=True)
+        size_a = sizes_a[np.searchsorted(labels_a, pair_a)]
+        size_b = sizes_b[np.searchsorted(labels_b, pair_b)]
+        agree = pair_counts >= self.min_agreement * (size_a + size_b - pair_counts)
+        return np.stack([pair_a[agree], pair_b[agree]])
+
+    def finish(self) -> np.ndarray:
+        """Merge joined segments and relabel them consecutively; returns the label map."""
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        count = self._next_label
+        if self._edges:
+            edges = np.concatenate(self._edges, axis=1)
+            graph = coo_matrix((np.ones(edges.shape[1], dtype=np.int8), (edges[0], edges[1])), shape=(count, count))
+            _, component = connected_components(graph, directed=False)
+        else:
+            component = np.arange(count)
+        self._edges.clear()
+        self._overlaps.clear()
+
+        # Pixels no tile claimed keep their own tile's segment
+        used = np.zeros(count, dtype=bool)
+        for tile in self.tiles:
+            core = self.labels[tile.core]
+            np.invert(core, out=core, where=core < 0)
+            used[component[np.unique(core)]] = True
+
+        # Segments that only existed in overlaps never reach the output; leave no gaps for them
+        rank = np.cumsum(used, dtype=np.int64) - 1
+        mapping = rank[component].astype(np.int32)
+
+        areas = np.zeros(int(used.sum()), dtype=np.int64)
+        for tile in self.tiles:
+            core = mapping[self.labels[tile.core]]
+            self.labels[tile.core] = core
+            areas += np.bincount(core.ravel(), minlength=len(areas))
+        self.areas = areas
+        return self.labels
+
+
+async def run_tiled(
+    executor,
+    algorithm_name: str,
+    image: np.ndarray,
+    parameters: Dict[str, Any],
+    image_key: Optional[str] = None
+) -> Tuple[np.ndarray, SegmentationMetrics]:
+    """Segment a large image as overlapping tiles on ``executor`` and stitch the result.
+
+    Tiles run in parallel (at most TILED_MAX_PARALLEL_TILES at a time, so memory
+    stays bounded per tile) and the whole run gets SEGMENTATION_TIMEOUT, like an
+    untiled job (so it stays inside the single-flight lease). Memory stages
+    report the largest tile's peak and all tiles' net (stitching runs in this
+    process and is not profiled). The overlap grows to the algorithm's typical
+    segment size (up to half a tile) so whole segments fit into it.
+    """
+    start_time = time.time()
+    algorithm = get_algorithm(algorithm_name)
+    overlap = max(settings.TILE_OVERLAP, int(np.ceil(algorithm.segment_size(parameters, image.shape) or 0)))
+    tiles = plan_tiles(image.shape, settings.TILE_SIZE, min(overlap, settings.TILE_SIZE // 2))
+    stitcher = TileStitcher(image.shape, tiles)
+    image_area = image.shape[0] * image.shape[1]
+    semaphore = asyncio.Semaphore(settings.TILED_MAX_PARALLEL_TILES or executor.max_workers)
+
+    async def run_tile(tile: Tile) -> SegmentationMetrics:
+        async with semaphore:
+            tile_image = np.ascontiguousarray(image[tile.window])
+            rows, cols = tile.window
+            labels, metrics = await executor.run(
+                algorithm_name,
+                tile_image,
+                algorithm.crop_parameters(parameters, tile.area / image_area),
+                image_key=f"{image_key}@tile:{rows.start}:{cols.start}:{rows.stop}:{cols.stop}" if image_key else None
+            )
+            await asyncio.to_thread(stitcher.add, tile, labels)
+            return metrics
+
+    # On timeout the pending tiles are cancelled with the gather
+    tile_metrics = await asyncio.wait_for(
+        asyncio.gather(*[run_tile(tile) for tile in tiles]),
+        timeout=settings.SEGMENTATION_TIMEOUT
+    )
+    profiler = MemoryProfiler()
+    for tile_metric in tile_metrics:
+        profiler.merge(tile_metric.memory_stages)
+    labels = await asyncio.to_thread(stitcher.finish)
+
+    metrics = SegmentationMetrics(
+        segments_count=len(stitcher.areas),
+        processing_time=time.time() - start_time,
+        parameters_used=parameters,
+        segment_stats=summarize_segment_sizes(stitcher.areas, int(labels.size))
+    )
+    record_memory(metrics, profiler)
+    logger.info(
+        "Tiled segmentation completed",
+        algorithm=algorithm_name,
+        tiles=len(tiles),
+        segments_count=metrics.segments_count,
+        processing_time=metrics.processing_time
+    )
+    return labels, metrics
@@ -0,0 +1,68 @@
+# app/ml/warm_start.py
+import hashlib
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.utils.cache import LRUCache, nested_nbytes
+
+
+def state_digest(state: Dict[str, Any]) -> str:
+    """Short hash of a warm-start state; runs seeded from equal states give equal results."""
+    digest = hashlib.blake2b(digest_size=8)
+    for name in sorted(state):
+        value = state[name]
+        digest.update(name.encode())
+        if isinstance(value, np.ndarray):
+            digest.update(f"{value.dtype}{value.shape}".encode())
+            digest.update(np.ascontiguousarray(value).tobytes())
+        else:
+            digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+
+class WarmStartStore:
+    """State left by the last run of an algorithm, kept per (session, image, algorithm).
+
+    Lives in the API process so it survives whichever worker the next job lands on.
+    Bounded by entry count and bytes; only sessions (e.g. WebSocket connections)
+    get warm starts, so unrelated clients never influence each other's results.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self._entries = LRUCache(
+            max_entries=max_entries if max_entries is not None else settings.WARM_START_MAX_ENTRIES,
+            max_bytes=max_bytes if max_bytes is not None else settings.WARM_START_MAX_BYTES,
+            sizeof=nested_nbytes
+        )
+
+    @staticmethod
+    def _key(session_id: str, image_id: str, algorithm_name: str) -> Tuple[str, str, str]:
+        return (session_id, image_id, algorithm_name)
+
+    def get(self, session_id: str, image_id: str, algorithm_name: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(self._key(session_id, image_id, algorithm_name))
+
+    def put(self, session_id: str, image_id: str, algorithm_name: str, state: Dict[str, Any]) -> None:
+        self._entries.put(self._key(session_id, image_id, algorithm_name), state)
+
+    def discard_session(self, session_id: str) -> None:
+        """Forget everything stored for a session (e.g. when its WebSocket closes)."""
+        for key in self._entries.keys():
+            if key[0] == session_id:
+                self._entries.pop(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return self._entries.stats()
+
+
+_store: Optional[WarmStartStore] = None
+
+
+def get_warm_start_store() -> WarmStartStore:
+    """Get the process-wide warm start store."""
+    global _store
+    if _store is None:
+        _store = WarmStartStore()
+    return _store
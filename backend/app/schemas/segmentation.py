@@ -22,6 +22,7 @@ class ParameterSchema(BaseModel):
     min_value: Optional[Union[int, float]] = None
     max_value: Optional[Union[int, float]] = None
     step: Optional[Union[int, float]] = None
+    options: Optional[List[str]] = None  # allowed values of "string" parameters
     type: str  # "int", "float", "string", "bool"
 
 # Algorithm Configuration
@@ -47,22 +48,45 @@ class SegmentationRequest(BaseModel):
             raise ValueError('Maximum 4 algorithms allowed')
         return v
 
+# Memory of one pipeline stage, in MB
+class StageMemoryUsage(BaseModel):
+    peak: float  # highest allocation during the stage
+    net: float  # still allocated when the stage ended
+
 # Performance Metrics
 class PerformanceMetrics(BaseModel):
     processing_time: float
-    memory_usage: Optional[float] = None
+    memory_usage: Optional[float] = None  # peak MB over all stages
+    memory_net: Optional[float] = None  # MB left allocated by all stages
+    memory_stages: Optional[Dict[str, StageMemoryUsage]] = None  # "segment", "statistics" (measured in worker processes)
     segments_count: int
     algorithm_name: str
     image_dimensions: tuple[int, int]
+    image_format: Optional[str] = None  # encoding of the result image ("palette_png", "png", "webp")
+    encode_time: Optional[float] = None  # seconds spent coloring and encoding the result image
+    encoded_bytes: Optional[int] = None  # size of the result image
+
+# Segment size statistics
+class SegmentStatistics(BaseModel):
+    num_segments: int
+    min_segment_size: int
+    max_segment_size: int
+    mean_segment_size: float
+    std_segment_size: float
+    total_pixels: int
 
 # Segmentation Result
 class SegmentationResult(BaseModel):
     algorithm_name: AlgorithmType
     result_image_url: str
+    result_id: Optional[str] = None  # key of the stored label map (see /results/{result_id}/...)
+    labels_url: Optional[str] = None  # stored label map (.npy, or .npz when compressed)
     segments_count: int
     processing_time: float
     parameters_used: Dict[str, Any]
     metrics: Optional[PerformanceMetrics] = None
+    segment_stats: Optional[SegmentStatistics] = None
+    resolution_level: int = 0  # image pyramid level: 0 = full resolution, n = downscaled by 2**n
     created_at: datetime = Field(default_factory=datetime.now)
     
     class Config:
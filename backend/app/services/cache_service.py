@@ -1,85 +1,482 @@
 
 # app/services/cache_service.py
-import json
+import asyncio
+import datetime
+import fnmatch
+import time
+import uuid
+import msgpack
+import numpy as np
 import structlog
-from typing import Any, Optional
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 import redis.asyncio as redis
 
 from app.config import settings
+from app.utils.cache import LRUCache
 
 logger = structlog.get_logger()
 
-class CacheService:
+# Channels on which workers announce deleted keys/patterns and tags so peers drop their local copies
+INVALIDATION_CHANNEL = "cache:invalidate"
+TAG_INVALIDATION_CHANNEL = "cache:invalidate:tag"
+
+# Redis sorted set per tag holding the keys written with it, scored by their expiry time
+TAG_PREFIX = "cache:tag:"
+# Redis set per tagged key holding its tags, so a deleted key can leave every tag's index
+KEY_TAGS_PREFIX = "cache:keytags:"
+# Tag indexes being invalidated are renamed here, so concurrent writes start a fresh index
+INVALIDATING_TAG_PREFIX = "cache:tag-invalidating:"
+
+# Lease keys: which worker is computing the value of a key
+LEASE_PREFIX = "lease:"
+
+# Deletes the lease only if it still holds our token (it may have expired and been re-taken)
+_RELEASE_LEASE = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Adds ARGV[1] (expiring at ARGV[2]) to each tag index, prunes members that expired
+# before ARGV[3] and lets the index expire with its newest member
+_INDEX_TAGS = """
+for _, index in ipairs(KEYS) do
+    redis.call("zadd", index, ARGV[2], ARGV[1])
+    redis.call("zremrangebyscore", index, "-inf", ARGV[3])
+    local newest = redis.call("zrange", index, -1, -1, "withscores")[2]
+    if newest == "inf" then
+        redis.call("persist", index)
+    else
+        redis.call("expireat", index, math.ceil(tonumber(newest)))
+    end
+end
+return #KEYS
+"""
+
+
+def _default(value: Any) -> Any:
+    # What json.dumps(default=str) used to flatten; NumPy scalars and arrays keep their values
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def pack(value: Any) -> bytes:
+    return msgpack.packb(value, default=_default, use_bin_type=True)
+
+
+def unpack(data: bytes) -> Any:
+    return msgpack.unpackb(data, raw=False)
+
+
+class TierStats:
+    """Hits, misses and lookup latency of one cache tier."""
+
     def __init__(self):
-        self.redis_client: Optional[redis.Redis] = None
-    
-    async def init_redis(self):
-        """Initialize Redis connection."""
-        try:
-            self.redis_client = redis.from_url(
-                settings.REDIS_URL,
-                encoding="utf-8",
-                decode_responses=True
-            )
-            # Test connection
-            await self.redis_client.ping()
-            logger.info("Redis connection initialized")
-        except Exception as e:
-            logger.error("Failed to connect to Redis", error=str(e))
-            self.redis_client = None
-    
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.lookup_time = 0.0
+
+    def record(self, hit: bool, elapsed: float) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self.lookup_time += elapsed
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "avg_lookup_ms": self.lookup_time / lookups * 1000 if lookups else 0.0
+        }
+
+
+# Local tier entries are (expiry time or None, packed value, tags), sized by the packed bytes
+_local: Optional[LRUCache] = None
+# tag -> keys of local entries written with it
+_local_tags: Dict[str, Set[str]] = {}
+_tier_stats = {"local": TierStats(), "redis": TierStats()}
+
+
+def _untag_local(key: str, entry: Tuple) -> None:
+    for tag in entry[2]:
+        keys = _local_tags.get(tag)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del _local_tags[tag]
+
+
+def get_local_cache() -> LRUCache:
+    """The in-process tier shared by every CacheService of this worker."""
+    global _local
+    if _local is None:
+        _local = LRUCache(
+            max_entries=settings.LOCAL_CACHE_MAX_ENTRIES,
+            max_bytes=settings.LOCAL_CACHE_MAX_BYTES,
+            sizeof=lambda entry: len(entry[1]),
+            on_evict=_untag_local
+        )
+    return _local
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    local = get_local_cache()
+    return {
+        "local": {**_tier_stats["local"].stats(), "entries": len(local), "bytes": local.total_bytes},
+        "redis": _tier_stats["redis"].stats()
+    }
+
+
+def _drop_local(key: str) -> bool:
+    entry = get_local_cache().pop(key)
+    if entry is None:
+        return False
+    _untag_local(key, entry)
+    return True
+
+
+def invalidate_local(pattern: str) -> int:
+    """Drop local entries matching a key or glob pattern."""
+    keys = [key for key in get_local_cache().keys() if fnmatch.fnmatchcase(key, pattern)]
+    return sum(_drop_local(key) for key in keys)
+
+
+def invalidate_local_tag(tag: str) -> int:
+    """Drop local entries written with a tag."""
+    return sum(_drop_local(key) for key in list(_local_tags.pop(tag, ())))
+
+
+def _text(value: Any) -> str:
+    # The shared Redis client returns bytes
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _batches(keys: List[Any], size: int) -> Iterable[List[Any]]:
+    for start in range(0, len(keys), size):
+        yield keys[start:start + size]
+
+
+class CacheService:
+    """Two-tier cache: a bounded in-process LRU in front of Redis, msgpack-encoded.
+
+    Reads try the local tier first, so results this worker just produced are served
+    without a network round trip; Redis hits are copied into the local tier. Deletes
+    are published on INVALIDATION_CHANNEL so other workers drop their local copies.
+
+    Entries can be written with tags (e.g. "image:<hash>"); each tag is a Redis sorted
+    set of its keys scored by expiry, pruned on every write, so it only ever holds
+    about the live entries and invalidate_tags() costs O(entries with the tag)
+    instead of a scan of the keyspace. clear_pattern() remains for untagged (legacy) keys.
+    """
+
+    def __init__(self, redis_client: Optional[redis.Redis] = None):
+        # The application's pooled client (see app.core.container); None caches locally only
+        self.redis_client = redis_client
+
+    def _get_local(self, key: str) -> Optional[bytes]:
+        start = time.perf_counter()
+        entry = get_local_cache().get(key)
+        if entry is not None and entry[0] is not None and entry[0] <= time.time():
+            _drop_local(key)
+            entry = None
+        _tier_stats["local"].record(entry is not None, time.perf_counter() - start)
+        return entry[1] if entry is not None else None
+
+    def _set_local(self, key: str, data: bytes, ttl: Optional[int], tags: Tuple[str, ...] = ()) -> None:
+        if get_local_cache().put(key, (time.time() + ttl if ttl else None, data, tags)):
+            for tag in tags:
+                _local_tags.setdefault(tag, set()).add(key)
+
     async def get(self, key: str) -> Optional[Any]:
         """Get value from cache."""
+        data = self._get_local(key)
+        if data is not None:
+            return unpack(data)
+
         if not self.redis_client:
             return None
-        
+
+        start = time.perf_counter()
         try:
-            value = await self.redis_client.get(key)
-            if value:
-                return json.loads(value)
-            return None
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.get(key)
+                pipe.ttl(key)
+                data, ttl = await pipe.execute()
         except Exception as e:
+            _tier_stats["redis"].errors += 1
             logger.warning("Cache get failed", key=key, error=str(e))
             return None
-    
-    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
-        """Set value in cache."""
+        _tier_stats["redis"].record(data is not None, time.perf_counter() - start)
+        if data is None:
+            return None
+
+        try:
+            value = unpack(data)
+        except Exception as e:
+            # e.g. a JSON entry written before the switch to msgpack
+            logger.warning("Cache entry could not be decoded", key=key, error=str(e))
+            return None
+        self._set_local(key, data, ttl if ttl and ttl > 0 else None)
+        return value
+
+    async def set(
+        self,
+        key: str,
+        value: Any,
+        ttl: Optional[int] = None,
+        tags: Iterable[str] = ()
+    ) -> bool:
+        """Set value in cache, recording the key under each tag."""
+        tags = tuple(tags)
+        try:
+            data = pack(value)
+        except Exception as e:
+            logger.warning("Cache set failed", key=key, error=str(e))
+            return False
+        self._set_local(key, data, ttl, tags)
+
         if not self.redis_client:
             return False
-        
+
         try:
-            serialized_value = json.dumps(value, default=str)
-            if ttl:
-                await self.redis_client.setex(key, ttl, serialized_value)
-            else:
-                await self.redis_client.set(key, serialized_value)
+            now = time.time()
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                if ttl:
+                    pipe.setex(key, ttl, data)
+                else:
+                    pipe.set(key, data)
+                if tags:
+                    key_tags = f"{KEY_TAGS_PREFIX}{key}"
+                    pipe.sadd(key_tags, *tags)
+                    if ttl:
+                        pipe.expire(key_tags, ttl)
+                    else:
+                        pipe.persist(key_tags)
+                    pipe.eval(
+                        _INDEX_TAGS, len(tags), *(f"{TAG_PREFIX}{tag}" for tag in tags),
+                        key, now + ttl if ttl else "+inf", now
+                    )
+                await pipe.execute()
             return True
         except Exception as e:
             logger.warning("Cache set failed", key=key, error=str(e))
             return False
-    
+
+    async def _publish_invalidation(self, message: Any, channel: str = INVALIDATION_CHANNEL) -> None:
+        try:
+            await self.redis_client.publish(channel, message)
+        except Exception as e:
+            logger.warning("Cache invalidation publish failed", channel=channel, error=str(e))
+
+    async def _unlink(self, keys: List[Any]) -> int:
+        """Delete keys in pipelined batches; UNLINK frees the memory off Redis's main thread."""
+        if not keys:
+            return 0
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for batch in _batches(keys, settings.CACHE_INVALIDATION_BATCH_SIZE):
+                pipe.unlink(*batch)
+            return sum(await pipe.execute())
+
+    async def _unlink_tagged(self, keys: List[Any], skip_tags: Iterable[str] = ()) -> int:
+        """Delete keys and remove them from the index of every tag they were written with.
+
+        ``skip_tags`` are indexes being dropped as a whole, which need no removals.
+        """
+        if not keys:
+            return 0
+        skip_tags = set(skip_tags)
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.smembers(f"{KEY_TAGS_PREFIX}{_text(key)}")
+            key_tags = await pipe.execute()
+        
+        members: Dict[str, List[Any]] = {}
+        for key, tags in zip(keys, key_tags):
+            for tag in map(_text, tags):
+                if tag not in skip_tags:
+                    members.setdefault(tag, []).append(key)
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.unlink(*keys)
+            pipe.unlink(*(f"{KEY_TAGS_PREFIX}{_text(key)}" for key in keys))
+            for tag, tagged in members.items():
+                pipe.zrem(f"{TAG_PREFIX}{tag}", *tagged)
+            deleted, *_ = await pipe.execute()
+        return deleted
+
     async def delete(self, key: str) -> bool:
         """Delete key from cache."""
+        _drop_local(key)
         if not self.redis_client:
             return False
-        
+
         try:
-            await self.redis_client.delete(key)
+            await self._unlink_tagged([key])
+            await self._publish_invalidation(key)
             return True
         except Exception as e:
             logger.warning("Cache delete failed", key=key, error=str(e))
             return False
-    
-    async def clear_pattern(self, pattern: str) -> int:
-        """Clear all keys matching pattern."""
+
+    async def acquire_lease(self, key: str, ttl: float) -> Optional[str]:
+        """Claim the computation of ``key`` across workers for ``ttl`` seconds.
+
+        Returns a token for release_lease(), or None while another worker holds the
+        lease. Without Redis, or if Redis fails, the lease is always granted.
+        """
+        token = uuid.uuid4().hex
         if not self.redis_client:
+            return token
+        try:
+            acquired = await self.redis_client.set(
+                f"{LEASE_PREFIX}{key}", token, nx=True, px=int(ttl * 1000)
+            )
+        except Exception as e:
+            logger.warning("Cache lease acquire failed", key=key, error=str(e))
+            return token
+        return token if acquired else None
+
+    async def release_lease(self, key: str, token: str) -> None:
+        if not self.redis_client:
+            return
+        try:
+            await self.redis_client.eval(_RELEASE_LEASE, 1, f"{LEASE_PREFIX}{key}", token)
+        except Exception as e:
+            logger.warning("Cache lease release failed", key=key, error=str(e))
+
+    async def invalidate_tags(self, *tags: str) -> int:
+        """Delete every entry written with any of the tags.
+
+        Each tag index is first renamed aside, so entries written concurrently start
+        a fresh index instead of being lost from it. The renamed indexes are then
+        read with ZSCAN, and their keys deleted, removed from their other tags'
+        indexes and announced to peers, CACHE_INVALIDATION_BATCH_SIZE at a time.
+        """
+        cleared = sum(invalidate_local_tag(tag) for tag in tags)
+        if not self.redis_client or not tags:
+            return cleared
+
+        try:
+            invalidating = [f"{INVALIDATING_TAG_PREFIX}{uuid.uuid4().hex}" for _ in tags]
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for tag, index in zip(tags, invalidating):
+                    pipe.rename(f"{TAG_PREFIX}{tag}", index)
+                # Tags without an index fail with "no such key"
+                renamed = await pipe.execute(raise_on_error=False)
+            await self._publish_invalidation(pack({"tags": list(tags), "keys": []}), TAG_INVALIDATION_CHANNEL)
+            
+            batch_size = settings.CACHE_INVALIDATION_BATCH_SIZE
+            deleted = 0
+            for index, result in zip(invalidating, renamed):
+                if isinstance(result, Exception):
+                    continue
+                now = time.time()
+                batch = []
+                async for key, expires_at in self.redis_client.zscan_iter(index, count=batch_size):
+                    # Expired members are already gone, with their tags
+                    if expires_at > now:
+                        batch.append(key)
+                    if len(batch) >= batch_size:
+                        deleted += await self._invalidate_batch(batch, tags)
+                        batch = []
+                deleted += await self._invalidate_batch(batch, tags)
+                await self.redis_client.unlink(index)
+            logger.info("Cache tags invalidated", tags=list(tags), deleted=deleted)
+            return deleted
+        except Exception as e:
+            logger.warning("Cache tag invalidation failed", tags=list(tags), error=str(e))
+            return cleared
+
+    async def _invalidate_batch(self, keys: List[Any], tags: Tuple[str, ...]) -> int:
+        if not keys:
             return 0
-        
+        deleted = await self._unlink_tagged(keys, skip_tags=tags)
+        # Peers may hold Redis hits in their local tier without tags, so send the keys too
+        await self._publish_invalidation(
+            pack({"tags": [], "keys": [_text(key) for key in keys]}), TAG_INVALIDATION_CHANNEL
+        )
+        return deleted
+
+    async def clear_pattern(self, pattern: str) -> int:
+        """Clear all keys matching pattern.
+
+        Walks the keyspace with SCAN (never KEYS, which blocks Redis), so the cost
+        is O(total keys); prefer invalidate_tags() for anything written with tags.
+        """
+        cleared = invalidate_local(pattern)
+        if not self.redis_client:
+            return cleared
+
         try:
-            keys = await self.redis_client.keys(pattern)
-            if keys:
-                await self.redis_client.delete(*keys)
-            return len(keys)
+            batch_size = settings.CACHE_INVALIDATION_BATCH_SIZE
+            deleted = 0
+            batch = []
+            async for key in self.redis_client.scan_iter(match=pattern, count=batch_size):
+                batch.append(key)
+                if len(batch) >= batch_size:
+                    deleted += await self._unlink(batch)
+                    batch = []
+            deleted += await self._unlink(batch)
+            await self._publish_invalidation(pattern)
+            return deleted
         except Exception as e:
             logger.warning("Cache clear pattern failed", pattern=pattern, error=str(e))
-            return 0
\ No newline at end of file
+            return 0
+
+
+_listener: Optional[Tuple[asyncio.Task, Any]] = None
+
+
+async def _listen(pubsub) -> None:
+    while True:
+        try:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if message is None:
+                continue
+            if _text(message["channel"]) == TAG_INVALIDATION_CHANNEL:
+                invalidated = unpack(message["data"])
+                for tag in invalidated["tags"]:
+                    invalidate_local_tag(tag)
+                for key in invalidated["keys"]:
+                    _drop_local(key)
+            else:
+                invalidate_local(_text(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Cache invalidation listener error", error=str(e))
+            await asyncio.sleep(1.0)
+
+
+async def start_invalidation_listener(client: Optional[redis.Redis]) -> None:
+    """Drop local entries whenever any worker deletes them (needs Redis)."""
+    global _listener
+    if client is None or _listener is not None:
+        return
+    pubsub = client.pubsub()
+    await pubsub.subscribe(INVALIDATION_CHANNEL, TAG_INVALIDATION_CHANNEL)
+    _listener = (asyncio.create_task(_listen(pubsub)), pubsub)
+
+
+async def stop_invalidation_listener() -> None:
+    global _listener
+    if _listener is None:
+        return
+    task, pubsub = _listener
+    _listener = None
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    await pubsub.close()
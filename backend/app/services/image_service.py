@@ -1,79 +1,236 @@
 
 # app/services/image_service.py
 import os
+import time
 import uuid
-import aiofiles
 from typing import Optional, Tuple
 import numpy as np
 from PIL import Image
-import io
 import structlog
 
 from app.config import settings
+from app.db.image_index import ImageRecord, get_image_index
 from app.schemas.image import ImageInfo, ImageUploadResponse
-from app.utils.image_utils import resize_image, validate_image
+from app.utils.cache import LRUCache
+from app.utils.encoding import EncodedImage, encode_rgb_image
+from app.utils.file_io import open_atomic, run_io, write_file_atomic
+from app.utils.image_utils import content_hash, resize_image, validate_image
 
 logger = structlog.get_logger()
 
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
+
+_image_cache: Optional[LRUCache] = None
+
+
+def get_image_cache() -> LRUCache:
+    """Decoded uploads of this process, by image id, within IMAGE_CACHE_MAX_BYTES."""
+    global _image_cache
+    if _image_cache is None:
+        _image_cache = LRUCache(max_bytes=settings.IMAGE_CACHE_MAX_BYTES)
+    return _image_cache
+
+
 class ImageService:
+    """Uploads and result images on disk.
+    
+    Uploads are found through the image index (app.db.image_index); the upload
+    directory is only probed for images uploaded before the index existed. Every
+    file access and image decode/encode runs on the I/O pool (app.utils.file_io),
+    never on the event loop.
+    """
+    
     def __init__(self):
         self.upload_path = settings.UPLOAD_PATH
         os.makedirs(self.upload_path, exist_ok=True)
+    
+    def _find_image(self, image_id: str) -> Optional[str]:
+        for ext in IMAGE_EXTENSIONS:
+            filename = f"{image_id}{ext}"
+            if os.path.exists(os.path.join(self.upload_path, filename)):
+                return filename
+        return None
+    
+    def _legacy_record(self, image_id: str) -> Optional[ImageRecord]:
+        """Describe an unindexed upload from its file header (pixels are not decoded)."""
+        filename = self._find_image(image_id)
+        if filename is None:
+            return None
+        file_path = os.path.join(self.upload_path, filename)
+        with Image.open(file_path) as image:
+            width, height = image.size
+            image_format = image.format or ""
+        raw_filename = self._raw_filename(image_id)
+        return ImageRecord(
+            image_id=image_id,
+            filename=filename,
+            format=image_format,
+            content_type=Image.MIME.get(image_format, ""),
+            width=width,
+            height=height,
+            size=os.path.getsize(file_path),
+            content_hash="",
+            raw_filename=raw_filename if os.path.exists(os.path.join(self.upload_path, raw_filename)) else None
+        )
+    
+    @staticmethod
+    def _raw_filename(image_id: str) -> str:
+        return f"{image_id}_rgb.npy"
+    
+    def _raw_path(self, image_id: str) -> str:
+        return os.path.join(self.upload_path, self._raw_filename(image_id))
+    
+    def _write_raw(self, image_id: str, pixels: np.ndarray) -> None:
+        with open_atomic(self._raw_path(image_id)) as f:
+            np.lib.format.write_array(f, np.ascontiguousarray(pixels), allow_pickle=False)
+    
+    def _load_image(self, record: ImageRecord) -> Tuple[np.ndarray, bool]:
+        """Pixels of an upload, and whether a raw copy was written for it just now."""
+        if settings.STORE_RAW_PIXELS:
+            try:
+                # Zero-copy from the page cache; read-only
+                return np.load(self._raw_path(record.image_id), mmap_mode="r", allow_pickle=False).view(np.ndarray), False
+            except FileNotFoundError:
+                pass
+        with Image.open(os.path.join(self.upload_path, record.filename)) as image:
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            pixels = np.array(image)
+        if settings.STORE_RAW_PIXELS:
+            # Uploads from before raw storage: decode once, map from now on
+            self._write_raw(record.image_id, pixels)
+            return pixels, True
+        return pixels, False
+    
+    @staticmethod
+    def _prepare_upload(image: Image.Image) -> Tuple[Image.Image, np.ndarray, str]:
+        """Resize if too large; returns the image, its RGB pixels and their content hash."""
+        if max(image.size) > settings.MAX_IMAGE_DIMENSION:
+            image = resize_image(image, settings.MAX_IMAGE_DIMENSION)
+        pixels = np.asarray(image.convert('RGB') if image.mode != 'RGB' else image)
+        return image, pixels, content_hash(pixels)
+    
+    def _save_upload(
+        self,
+        image_id: str,
+        image: Image.Image,
+        pixels: np.ndarray,
+        image_hash: str,
+        stored_filename: str,
+        original_filename: str,
+        content_type: str
+    ) -> ImageRecord:
+        file_path = os.path.join(self.upload_path, stored_filename)
+        image.save(file_path, quality=95, optimize=True)
+        
+        # The raw pixels are the canonical copy; the encoded file is what clients display
+        if settings.STORE_RAW_PIXELS:
+            self._write_raw(image_id, pixels)
+        
+        width, height = image.size
+        return ImageRecord(
+            image_id=image_id,
+            filename=stored_filename,
+            format=Image.registered_extensions().get(os.path.splitext(stored_filename)[1], ""),
+            content_type=content_type,
+            width=width,
+            height=height,
+            size=os.path.getsize(file_path),
+            content_hash=image_hash,
+            original_filename=original_filename,
+            raw_filename=self._raw_filename(image_id) if settings.STORE_RAW_PIXELS else None,
+            created_at=time.time()
+        )
+    
+    async def _find_duplicate(self, image_hash: str) -> Optional[ImageRecord]:
+        """An earlier upload with the same pixels whose file is still there."""
+        try:
+            record = await get_image_index().find_by_hash(image_hash)
+        except Exception as e:
+            logger.warning("Image index lookup failed", content_hash=image_hash, error=str(e))
+            return None
+        if record is None or not await run_io(os.path.exists, os.path.join(self.upload_path, record.filename)):
+            return None
+        return record
+    
+    async def get_image_record(self, image_id: str) -> Optional[ImageRecord]:
+        """Metadata of an upload, from the index (one lookup; no pixels are read)."""
+        try:
+            record = await get_image_index().get(image_id)
+            if record is not None:
+                return record
+        except Exception as e:
+            logger.warning("Image index lookup failed", image_id=image_id, error=str(e))
+        record = await run_io(self._legacy_record, image_id)
+        if record is not None:
+            await self._index(record)
+        return record
+    
+    async def _index(self, record: ImageRecord) -> None:
+        try:
+            await get_image_index().add(record)
+        except Exception as e:
+            # Still reachable by probing the upload directory
+            logger.warning("Failed to index image", image_id=record.image_id, error=str(e))
         
     async def upload_image(self, file_content: bytes, filename: str, content_type: str) -> ImageUploadResponse:
         """Upload and process an image file."""
         
         try:
             # Validate image
-            image = validate_image(file_content)
+            image = await run_io(validate_image, file_content)
             if image is None:
                 return ImageUploadResponse(
                     success=False,
                     message="Invalid image format"
                 )
             
-            # Generate unique ID and filename
-            image_id = str(uuid.uuid4())
-            file_extension = os.path.splitext(filename)[1].lower()
-            if not file_extension:
-                file_extension = '.jpg'
-            
-            stored_filename = f"{image_id}{file_extension}"
-            file_path = os.path.join(self.upload_path, stored_filename)
+            # Resize if too large and hash the pixels, once per image
+            image, pixels, image_hash = await run_io(self._prepare_upload, image)
             
-            # Resize if too large
-            if max(image.size) > settings.MAX_IMAGE_DIMENSION:
-                image = resize_image(image, settings.MAX_IMAGE_DIMENSION)
+            # Identical pixels: reuse the stored image, and with it every cached result
+            record = await self._find_duplicate(image_hash) if settings.DEDUPLICATE_UPLOADS else None
+            duplicate = record is not None
             
-            # Save image
-            image.save(file_path, quality=95, optimize=True)
-            
-            # Get file stats
-            file_size = os.path.getsize(file_path)
+            if not duplicate:
+                # Generate unique ID and filename
+                image_id = str(uuid.uuid4())
+                file_extension = os.path.splitext(filename)[1].lower()
+                if not file_extension:
+                    file_extension = '.jpg'
+                
+                stored_filename = f"{image_id}{file_extension}"
+                
+                # Save and describe
+                record = await run_io(
+                    self._save_upload, image_id, image, pixels, image_hash, stored_filename, filename, content_type
+                )
+                await self._index(record)
             
             # Create image info
             image_info = ImageInfo(
-                id=image_id,
-                filename=stored_filename,
+                id=record.image_id,
+                filename=record.filename,
                 original_filename=filename,
-                url=f"/uploads/{stored_filename}",
-                content_type=content_type,
-                size=file_size,
-                dimensions=image.size
+                url=record.url,
+                content_type=record.content_type,
+                size=record.size,
+                dimensions=(record.width, record.height)
             )
             
             logger.info(
-                "Image uploaded successfully",
-                image_id=image_id,
+                "Image already uploaded" if duplicate else "Image uploaded successfully",
+                image_id=record.image_id,
                 filename=filename,
-                size=file_size,
-                dimensions=image.size
+                size=record.size,
+                dimensions=image_info.dimensions,
+                content_hash=image_hash
             )
             
             return ImageUploadResponse(
                 success=True,
                 image=image_info,
-                message="Image uploaded successfully",
+                message="Image already uploaded" if duplicate else "Image uploaded successfully",
                 upload_url=image_info.url
             )
             
@@ -85,36 +242,52 @@ class ImageService:
             )
     
     async def get_image_data(self, image_id: str) -> Optional[np.ndarray]:
-        """Load image data as numpy array."""
+        """Load image data as a read-only numpy array (cached; memory-mapped from the raw copy if stored)."""
+        cache = get_image_cache()
+        image = cache.get(image_id)
+        if image is not None:
+            return image
         try:
-            # Find image file
-            for ext in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']:
-                file_path = os.path.join(self.upload_path, f"{image_id}{ext}")
-                if os.path.exists(file_path):
-                    break
-            else:
+            record = await self.get_image_record(image_id)
+            if record is None:
                 logger.warning("Image not found", image_id=image_id)
                 return None
-            
-            # Load image
-            image = Image.open(file_path)
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            return np.array(image)
+            image, raw_written = await run_io(self._load_image, record)
+            if raw_written:
+                record.raw_filename = self._raw_filename(image_id)
+                await self._index(record)
+            # Shared by every request for this image; nobody may modify it in place
+            image.flags.writeable = False
+            cache.put(image_id, image)
+            return image
             
         except Exception as e:
             logger.error("Failed to load image", image_id=image_id, error=str(e))
             return None
     
+    async def get_content_hash(self, image_id: str) -> Optional[str]:
+        """Content hash of an upload, from the index; hashed once for uploads from before hashing."""
+        record = await self.get_image_record(image_id)
+        if record is None:
+            return None
+        if not record.content_hash:
+            image = await self.get_image_data(image_id)
+            if image is None:
+                return None
+            record.content_hash = await run_io(content_hash, image)
+            await self._index(record)
+        return record.content_hash
+    
     async def get_image_url(self, image_id: str) -> Optional[str]:
         """Get image URL by ID."""
-        for ext in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']:
-            filename = f"{image_id}{ext}"
-            file_path = os.path.join(self.upload_path, filename)
-            if os.path.exists(file_path):
-                return f"/uploads/{filename}"
-        return None
+        record = await self.get_image_record(image_id)
+        if record is None:
+            return None
+        return record.url
+    
+    async def upload_exists(self, url: str) -> bool:
+        """Whether the file behind an /uploads URL still exists."""
+        return await run_io(os.path.exists, os.path.join(self.upload_path, os.path.basename(url)))
     
     async def save_result_image(self, image_array: np.ndarray, result_id: str) -> str:
         """Save segmentation result image."""
@@ -124,12 +297,19 @@ class ImageService:
                 # Normalize to 0-255 range
                 image_array = (image_array * 255).astype(np.uint8)
             
-            image = Image.fromarray(image_array)
+            encoded = await run_io(encode_rgb_image, image_array)
+            return await self.save_encoded_image(encoded, result_id)
             
-            # Save as PNG for better quality
-            filename = f"{result_id}_result.png"
+        except Exception as e:
+            logger.error("Failed to save result image", result_id=result_id, error=str(e))
+            raise
+    
+    async def save_encoded_image(self, encoded: EncodedImage, result_id: str) -> str:
+        """Save an already encoded result image (see app.utils.encoding)."""
+        try:
+            filename = f"{result_id}_result{encoded.extension}"
             file_path = os.path.join(self.upload_path, filename)
-            image.save(file_path, format='PNG', optimize=True)
+            await run_io(write_file_atomic, file_path, encoded.data)
             
             return f"/uploads/{filename}"
             
@@ -1,7 +1,7 @@
 # app/services/segmentation_service.py
 import asyncio
 import uuid
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 import numpy as np
 from PIL import Image
 import io
@@ -9,30 +9,98 @@ import base64
 import time
 import structlog
 
-from app.ml.algorithms import get_algorithm, get_available_algorithms
+from app.ml.algorithms import SegmentationMetrics, get_available_algorithms
+from app.ml.executors import get_algorithm_executor
+from app.ml.label_store import get_label_store
+from app.ml.metrics import compute_region_statistics
+from app.ml.preprocessing import get_pyramid_level, pyramid_level_for
+from app.ml.tiling import run_tiled, should_tile
+from app.ml.warm_start import get_warm_start_store, state_digest
 from app.schemas.segmentation import (
     SegmentationRequest, SegmentationResult, SegmentationResponse,
     AlgorithmConfig, PerformanceMetrics
 )
 from app.services.cache_service import CacheService
 from app.services.image_service import ImageService
-from app.utils.image_utils import labels_to_colored_image, overlay_segments
+from app.utils.encoding import EncodedImage, encode_label_image
+from app.utils.file_io import run_io
+from app.utils.image_utils import COLOR_SCHEMES, overlay_segments
 from app.config import settings
 
 logger = structlog.get_logger()
 
+
+class ResultCacheStats:
+    """Result cache lookups of this process.
+    
+    ``canonicalized`` counts lookups whose parameters canonicalization changed, and
+    ``canonical_hits`` the hits among them: requests that would have missed when
+    keyed by the parameters exactly as sent. ``coalesced`` counts misses that joined
+    an identical in-flight job of this process, ``peer_results`` those served by
+    another worker's computation.
+    """
+    
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.canonicalized = 0
+        self.canonical_hits = 0
+        self.coalesced = 0
+        self.peer_results = 0
+    
+    def record(self, hit: bool, canonicalized: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        if canonicalized:
+            self.canonicalized += 1
+            if hit:
+                self.canonical_hits += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "lookups": lookups,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "canonicalized": self.canonicalized,
+            "canonical_hits": self.canonical_hits,
+            "hit_rate_as_sent": (self.hits - self.canonical_hits) / lookups if lookups else 0.0,
+            "coalesced": self.coalesced,
+            "peer_results": self.peer_results
+        }
+
+
+_result_cache_stats = ResultCacheStats()
+
+
+def get_result_cache_stats() -> ResultCacheStats:
+    return _result_cache_stats
+
+
 class SegmentationService:
     def __init__(self, cache_service: CacheService, image_service: ImageService):
         self.cache_service = cache_service
         self.image_service = image_service
         self.algorithms = get_available_algorithms()
+        # cache key -> future of the job computing it in this process (see _coalesce)
+        self._in_flight: Dict[str, asyncio.Future] = {}
         
     async def process_segmentation_request(
         self, 
         request: SegmentationRequest,
-        callback=None
+        callback=None,
+        session_id: Optional[str] = None,
+        progressive: bool = False
     ) -> SegmentationResponse:
-        """Process a segmentation request with multiple algorithms."""
+        """Process a segmentation request with multiple algorithms.
+        
+        Requests sharing a ``session_id`` (e.g. one WebSocket connection) warm-start
+        supporting algorithms from the session's previous result on the same image.
+        With ``progressive`` each algorithm streams a low-resolution preview first.
+        """
         
         request_id = str(uuid.uuid4())
         start_time = time.time()
@@ -48,17 +116,25 @@ class SegmentationService:
         image_data = await self.image_service.get_image_data(request.image_id)
         if image_data is None:
             raise ValueError(f"Image not found: {request.image_id}")
+        # Computed at upload; identical images share cache entries and derived features
+        image_hash = await self.image_service.get_content_hash(request.image_id)
         
         # Process each algorithm
         results = []
         tasks = []
         
         for algorithm_config in request.algorithms:
+            algorithm_config, canonicalized = self._canonicalize(algorithm_config)
             task = self._process_single_algorithm(
                 image_data=image_data,
+                image_id=request.image_id,
+                image_hash=image_hash,
                 algorithm_config=algorithm_config,
+                canonicalized=canonicalized,
                 request_id=request_id,
-                callback=callback
+                callback=callback,
+                session_id=session_id,
+                progressive=progressive
             )
             tasks.append(task)
         
@@ -99,28 +175,53 @@ class SegmentationService:
     async def _process_single_algorithm(
         self,
         image_data: np.ndarray,
+        image_id: str,
+        image_hash: str,
         algorithm_config: AlgorithmConfig,
         request_id: str,
-        callback=None
+        callback=None,
+        session_id: Optional[str] = None,
+        progressive: bool = False,
+        canonicalized: bool = False
     ) -> Optional[SegmentationResult]:
-        """Process a single algorithm."""
+        """Process a single algorithm.
+        
+        ``image_hash`` is the image's content hash; it keys the result cache and the
+        executors' per-image caches. ``canonicalized`` tells the cache statistics
+        whether canonicalization changed the parameters. With ``progressive`` a downscaled preview is segmented and sent through the
+        callback first ("segmentation_preview"), then the full-resolution result. Only
+        the request that computes the result sends a preview; cache hits and coalesced
+        requests go straight to the result.
+        """
         
         try:
-            # Generate cache key
-            cache_key = self._generate_cache_key(image_data, algorithm_config)
+            # Seed from this session's previous run on the same image, if any
+            warm_start_store = get_warm_start_store()
+            use_warm_start = (
+                settings.ENABLE_WARM_START
+                and session_id is not None
+                and getattr(self.algorithms.get(algorithm_config.name), "supports_warm_start", False)
+            )
+            warm_start = (
+                warm_start_store.get(session_id, image_id, algorithm_config.name) if use_warm_start else None
+            )
+            
+            # Generate cache key; a seeded run depends on its seed, so the seed is part of
+            # the key and other sessions only ever get cold runs from the cold key
+            cache_key = self._generate_cache_key(image_hash, algorithm_config)
+            if warm_start is not None:
+                cache_key = f"{cache_key}:seed:{state_digest(warm_start)}"
             
             # Check cache first
-            cached_result = await self.cache_service.get(cache_key)
-            if cached_result:
+            result = await self._get_cached_result(cache_key)
+            get_result_cache_stats().record(result is not None, canonicalized)
+            if result is not None:
                 logger.info(
                     "Using cached result",
                     algorithm=algorithm_config.name,
                     request_id=request_id
                 )
-                return SegmentationResult(**cached_result)
-            
-            # Get algorithm instance
-            algorithm = get_algorithm(algorithm_config.name)
+                return result
             
             # Progress callback
             if callback:
@@ -130,56 +231,59 @@ class SegmentationService:
                     "request_id": request_id
                 })
             
-            # Perform segmentation
-            labels, metrics = algorithm.segment(image_data, algorithm_config.parameters)
-            
-            # Convert labels to colored image
-            colored_image = labels_to_colored_image(labels)
-            
-            # Save result image
-            result_image_id = f"{request_id}_{algorithm_config.name}"
-            result_image_url = await self.image_service.save_result_image(
-                colored_image, result_image_id
-            )
-            
-            # Create result
-            result = SegmentationResult(
-                algorithm_name=algorithm_config.name,
-                result_image_url=result_image_url,
-                segments_count=metrics.segments_count,
-                processing_time=metrics.processing_time,
-                parameters_used=metrics.parameters_used,
-                metrics=PerformanceMetrics(
-                    processing_time=metrics.processing_time,
-                    memory_usage=metrics.memory_usage,
-                    segments_count=metrics.segments_count,
+            async def compute() -> SegmentationResult:
+                # A preview's state depends only on the image and parameters, so a run seeded
+                # from it still belongs under the cold key
+                preview_warm_start = warm_start
+                if progressive and callback:
+                    preview_state = await self._send_preview(
+                        image_data, image_hash, algorithm_config, request_id, callback, warm_start
+                    )
+                    if preview_warm_start is None and preview_state is not None:
+                        preview_warm_start = preview_state
+                
+                result, metrics = await self._run_algorithm(
+                    image_data,
+                    image_key=image_hash,
                     algorithm_name=algorithm_config.name,
-                    image_dimensions=image_data.shape[:2]
+                    parameters=algorithm_config.parameters,
+                    result_image_id=f"{request_id}_{algorithm_config.name}",
+                    warm_start=preview_warm_start
                 )
-            )
+                if use_warm_start and metrics.state is not None:
+                    warm_start_store.put(session_id, image_id, algorithm_config.name, metrics.state)
+                
+                # Cache result
+                await self.cache_service.set(
+                    cache_key, 
+                    result.dict(), 
+                    ttl=settings.REDIS_CACHE_TTL,
+                    tags=self._cache_tags(image_hash, algorithm_config.name)
+                )
+                
+                logger.info(
+                    "Algorithm completed",
+                    algorithm=algorithm_config.name,
+                    processing_time=metrics.processing_time,
+                    segments_count=metrics.segments_count
+                )
+                return result
             
-            # Cache result
-            await self.cache_service.set(
-                cache_key, 
-                result.dict(), 
-                ttl=settings.REDIS_CACHE_TTL
-            )
+            # Identical concurrent jobs (other tabs, the grid view, other workers) share one run
+            if settings.COALESCE_SEGMENTATIONS:
+                result = await self._coalesce(cache_key, compute)
+            else:
+                result = await compute()
             
             # Progress callback
             if callback:
                 await callback({
                     "type": "segmentation_complete",
                     "result": result.dict(),
+                    "resolution_level": result.resolution_level,
                     "request_id": request_id
                 })
             
-            logger.info(
-                "Algorithm completed",
-                algorithm=algorithm_config.name,
-                processing_time=metrics.processing_time,
-                segments_count=metrics.segments_count
-            )
-            
             return result
             
         except Exception as e:
@@ -200,17 +304,321 @@ class SegmentationService:
             
             return None
     
-    def _generate_cache_key(self, image_data: np.ndarray, algorithm_config: AlgorithmConfig) -> str:
-        """Generate cache key for segmentation result."""
+    async def _coalesce(
+        self,
+        cache_key: str,
+        compute: Callable[[], Awaitable[SegmentationResult]]
+    ) -> SegmentationResult:
+        """Run ``compute`` once per cache key; concurrent callers in this process await
+        the same future, and _compute_leased keeps other workers from running it too.
+        """
+        while True:
+            future = self._in_flight.get(cache_key)
+            if future is None:
+                break
+            get_result_cache_stats().coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Only the computing request was cancelled: take over the job
+                if not future.cancelled():
+                    raise
+        
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[cache_key] = future
+        try:
+            result = await self._compute_leased(cache_key, compute)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Marked as retrieved so asyncio does not warn when nobody joined
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._in_flight.pop(cache_key, None)
+    
+    async def _compute_leased(
+        self,
+        cache_key: str,
+        compute: Callable[[], Awaitable[SegmentationResult]]
+    ) -> SegmentationResult:
+        """Run ``compute`` under a Redis lease on the cache key.
+        
+        While another worker holds the lease, poll the cache for its result; if the
+        lease is not released in SEGMENTATION_LEASE_TTL, compute anyway.
+        """
+        ttl = settings.SEGMENTATION_LEASE_TTL
+        deadline = time.monotonic() + ttl
+        token = await self.cache_service.acquire_lease(cache_key, ttl)
+        waited = token is None
+        while token is None:
+            await asyncio.sleep(settings.SEGMENTATION_LEASE_POLL_INTERVAL)
+            result = await self._get_cached_result(cache_key)
+            if result is not None:
+                get_result_cache_stats().peer_results += 1
+                return result
+            if time.monotonic() >= deadline:
+                logger.warning("Segmentation lease not released, computing anyway", cache_key=cache_key)
+                break
+            token = await self.cache_service.acquire_lease(cache_key, ttl)
+        
+        try:
+            # The holder may have finished between our last poll and taking the lease
+            result = await self._get_cached_result(cache_key) if waited else None
+            if result is not None:
+                get_result_cache_stats().peer_results += 1
+                return result
+            return await compute()
+        finally:
+            if token is not None:
+                await self.cache_service.release_lease(cache_key, token)
+    
+    async def _run_algorithm(
+        self,
+        image_data: np.ndarray,
+        image_key: str,
+        algorithm_name: str,
+        parameters: Dict[str, Any],
+        result_image_id: str,
+        warm_start: Optional[Dict[str, Any]] = None,
+        resolution_level: int = 0
+    ) -> Tuple[SegmentationResult, SegmentationMetrics]:
+        """Segment off the event loop, then color, encode and save the result image.
+        
+        Images above TILED_SEGMENTATION_THRESHOLD are segmented as stitched tiles
+        (without warm start, which describes the whole image). Memory is reported
+        per stage by the worker process (see MemoryProfiler); nothing is measured here,
+        where concurrent requests share the process.
+        """
+        executor = get_algorithm_executor(algorithm_name)
+        if should_tile(image_data.shape):
+            labels, metrics = await run_tiled(executor, algorithm_name, image_data, parameters, image_key=image_key)
+        else:
+            labels, metrics = await asyncio.wait_for(
+                executor.run(algorithm_name, image_data, parameters, image_key=image_key, warm_start=warm_start),
+                timeout=settings.SEGMENTATION_TIMEOUT
+            )
+        # Color and encode the labels (palette PNG or WebP, see RESULT_IMAGE_FORMAT)
+        encoded = await run_io(encode_label_image, labels)
+        
+        # Save the result image and keep full-resolution labels so derived outputs can be
+        # rebuilt without segmenting again; previews are superseded within seconds, so
+        # they are sent inline and never written
+        labels_url = None
+        if resolution_level == 0:
+            result_image_url = await self.image_service.save_encoded_image(encoded, result_image_id)
+            labels_file = await run_io(get_label_store().save, result_image_id, labels)
+            labels_url = f"/uploads/{labels_file}"
+        else:
+            result_image_url = encoded.data_url()
+        
+        result = SegmentationResult(
+            algorithm_name=algorithm_name,
+            result_image_url=result_image_url,
+            result_id=result_image_id if labels_url else None,
+            labels_url=labels_url,
+            segments_count=metrics.segments_count,
+            processing_time=metrics.processing_time,
+            parameters_used=metrics.parameters_used,
+            metrics=PerformanceMetrics(
+                processing_time=metrics.processing_time,
+                memory_usage=metrics.memory_usage,
+                memory_net=metrics.memory_net,
+                memory_stages={name: stage.to_dict() for name, stage in (metrics.memory_stages or {}).items()} or None,
+                segments_count=metrics.segments_count,
+                algorithm_name=algorithm_name,
+                image_dimensions=image_data.shape[:2],
+                image_format=encoded.format,
+                encode_time=encoded.encode_time,
+                encoded_bytes=encoded.nbytes
+            ),
+            segment_stats=metrics.segment_stats,
+            resolution_level=resolution_level
+        )
+        return result, metrics
+    
+    async def _send_preview(
+        self,
+        image_data: np.ndarray,
+        image_key: str,
+        algorithm_config: AlgorithmConfig,
+        request_id: str,
+        callback,
+        warm_start: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Segment a downscaled pyramid level and send it as a preview.
+        
+        The preview image is sent inline at the pyramid level's resolution, with its
+        ``scale``; clients stretch it over the full image. Its labels are not
+        upsampled or stored, since the full-resolution result replaces it.
+        Returns the preview's warm-start state moved to full resolution, if the
+        algorithm can reuse it. Failures only cost the preview.
+        """
+        level = pyramid_level_for(image_data.shape, settings.PROGRESSIVE_PREVIEW_MAX_DIMENSION)
+        algorithm = self.algorithms.get(algorithm_config.name)
+        if level == 0 or algorithm is None:
+            return None
+        
+        try:
+            preview_image = await asyncio.to_thread(get_pyramid_level, image_key, image_data, level)
+            scale = preview_image.shape[0] / image_data.shape[0]
+            if warm_start is not None:
+                warm_start = algorithm.scale_state(warm_start, scale, preview_image.shape)
+            
+            result, metrics = await self._run_algorithm(
+                preview_image,
+                image_key=f"{image_key}@{level}",
+                algorithm_name=algorithm_config.name,
+                parameters=algorithm.scale_parameters(algorithm_config.parameters, scale),
+                result_image_id=f"{request_id}_{algorithm_config.name}_level{level}",
+                warm_start=warm_start,
+                resolution_level=level
+            )
+            # Report the parameters the user chose, not their downscaled equivalents
+            result.parameters_used = algorithm_config.parameters
+            
+            await callback({
+                "type": "segmentation_preview",
+                "result": result.dict(),
+                "resolution_level": level,
+                "scale": scale,
+                "request_id": request_id
+            })
+            
+            if metrics.state is None:
+                return None
+            return algorithm.scale_state(metrics.state, 1 / scale, image_data.shape)
+            
+        except Exception as e:
+            logger.warning(
+                "Preview failed",
+                algorithm=algorithm_config.name,
+                resolution_level=level,
+                error=str(e),
+                request_id=request_id
+            )
+            return None
+    
+    async def _get_cached_result(self, cache_key: str) -> Optional[SegmentationResult]:
+        cached_result = await self.cache_service.get(cache_key)
+        return await self._restore_cached_result(cached_result) if cached_result else None
+    
+    async def _restore_cached_result(self, cached_result: Dict[str, Any]) -> Optional[SegmentationResult]:
+        """A cached result, with its image re-rendered from the stored labels if the file is gone.
+        
+        Returns None when neither the image nor the labels survive.
+        """
+        result = SegmentationResult(**cached_result)
+        if await self.image_service.upload_exists(result.result_image_url):
+            return result
+        if result.result_id is None:
+            return None
+        labels = await run_io(get_label_store().load, result.result_id)
+        if labels is None:
+            return None
+        encoded = await run_io(encode_label_image, labels)
+        result.result_image_url = await self.image_service.save_encoded_image(encoded, result.result_id)
+        logger.info("Re-rendered result from stored labels", result_id=result.result_id)
+        return result
+    
+    async def render_stored_result(
+        self,
+        result_id: str,
+        color_scheme: str = "default",
+        image_format: Optional[str] = None
+    ) -> Optional[Tuple[str, EncodedImage]]:
+        """Render a stored label map with a color scheme; returns the URL and the encoding."""
+        if color_scheme not in COLOR_SCHEMES:
+            raise ValueError(f"Unknown color scheme: {color_scheme}")
+        labels = await run_io(get_label_store().load, result_id)
+        if labels is None:
+            return None
+        encoded = await run_io(encode_label_image, labels, color_scheme, image_format)
+        url = await self.image_service.save_encoded_image(encoded, f"{result_id}_{color_scheme}")
+        return url, encoded
+    
+    async def get_result_segments(self, result_id: str, image_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Per-segment statistics of a stored label map; with ``image_id`` also mean colors."""
+        labels = await run_io(get_label_store().load, result_id)
+        if labels is None:
+            return None
+        image = None
+        if image_id is not None:
+            image = await self.image_service.get_image_data(image_id)
+            if image is None:
+                raise ValueError(f"Image not found: {image_id}")
+            if image.shape[:2] != labels.shape:
+                raise ValueError(f"Image {image_id} does not match result {result_id}")
+        stats = await asyncio.to_thread(compute_region_statistics, labels, image)
+        return {
+            "result_id": result_id,
+            "summary": stats.summary(),
+            "segments": stats.to_records()
+        }
+    
+    def _canonicalize(self, algorithm_config: AlgorithmConfig) -> Tuple[AlgorithmConfig, bool]:
+        """The config with canonical parameters, and whether they differ from the ones sent."""
+        algorithm = self.algorithms.get(algorithm_config.name)
+        if algorithm is None or not settings.CANONICALIZE_PARAMETERS:
+            return algorithm_config, False
+        try:
+            parameters = algorithm.canonicalize_parameters(algorithm_config.parameters)
+        except ValueError as e:
+            raise ValueError(f"{algorithm_config.name}: {e}")
+        if parameters == algorithm_config.parameters and all(
+            type(value) is type(algorithm_config.parameters[name]) for name, value in parameters.items()
+        ):
+            return algorithm_config, False
+        return algorithm_config.copy(update={"parameters": parameters}), True
+    
+    def _generate_cache_key(self, image_hash: str, algorithm_config: AlgorithmConfig) -> str:
+        """Generate cache key for segmentation result from the image's content hash."""
         import hashlib
         
-        # Create hash from image data and parameters
-        image_hash = hashlib.md5(image_data.tobytes()).hexdigest()[:8]
+        # Create hash from parameters; the image is identified by its content hash
         params_str = str(sorted(algorithm_config.parameters.items()))
         params_hash = hashlib.md5(params_str.encode()).hexdigest()[:8]
         
         return f"seg:{algorithm_config.name}:{image_hash}:{params_hash}"
     
+    def _cache_tags(self, image_hash: str, algorithm_name: str) -> List[str]:
+        """Tags a cached result is written with (see invalidate_image / invalidate_algorithm)."""
+        version = getattr(self.algorithms.get(algorithm_name), "version", None)
+        tags = [f"image:{image_hash}", f"algorithm:{algorithm_name}"]
+        if version is not None:
+            tags.append(f"algorithm:{algorithm_name}@{version}")
+        return tags
+    
+    async def invalidate_image(self, image_id: str, legacy: bool = False) -> int:
+        """Drop every cached result for an image; ``legacy`` also scans for untagged keys."""
+        image_hash = await self.image_service.get_content_hash(image_id)
+        if image_hash is None:
+            raise ValueError(f"Image not found: {image_id}")
+        deleted = await self.cache_service.invalidate_tags(f"image:{image_hash}")
+        if legacy:
+            deleted += await self.cache_service.clear_pattern(f"seg:*:{image_hash}:*")
+        return deleted
+    
+    async def invalidate_algorithm(
+        self,
+        algorithm_name: str,
+        version: Optional[str] = None,
+        legacy: bool = False
+    ) -> int:
+        """Drop cached results of an algorithm, or only those of one of its versions."""
+        if algorithm_name not in self.algorithms:
+            raise ValueError(f"Unknown algorithm: {algorithm_name}")
+        tag = f"algorithm:{algorithm_name}@{version}" if version else f"algorithm:{algorithm_name}"
+        deleted = await self.cache_service.invalidate_tags(tag)
+        if legacy:
+            deleted += await self.cache_service.clear_pattern(f"seg:{algorithm_name}:*")
+        return deleted
+    
     async def get_algorithm_info(self, algorithm_name: str) -> Dict[str, Any]:
         """Get information about a specific algorithm."""
         if algorithm_name not in self.algorithms:
@@ -220,6 +628,7 @@ class SegmentationService:
         return {
             "name": algorithm.name,
             "display_name": algorithm.display_name,
+            "version": algorithm.version,
             "default_parameters": algorithm.get_default_parameters(),
             "parameter_ranges": algorithm.get_parameter_ranges()
         }
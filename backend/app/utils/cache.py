@@ -0,0 +1,157 @@
+# app/utils/cache.py
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+def array_nbytes(value: Any) -> int:
+    """Default size function: NumPy arrays (and anything else exposing nbytes)."""
+    return int(getattr(value, "nbytes", 0))
+
+
+def nested_nbytes(value: Any) -> int:
+    """Size of arrays nested in tuples, lists and dicts."""
+    if isinstance(value, (tuple, list)):
+        return sum(nested_nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sum(nested_nbytes(item) for item in value.values())
+    return array_nbytes(value)
+
+
+class LRUCache:
+    """Thread-safe LRU mapping bounded by entry count and/or total bytes."""
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = array_nbytes,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a value and mark it as most recently used."""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Get a value without touching recency or hit counters."""
+        with self._lock:
+            return self._data.get(key, default)
+
+    def put(self, key: Hashable, value: Any, size: Optional[int] = None) -> bool:
+        """Insert a value, evicting least recently used entries to stay in budget.
+
+        Returns False (and stores nothing) if the value alone exceeds max_bytes.
+        """
+        size = self.sizeof(value) if size is None else size
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+        evicted = []
+        with self._lock:
+            if key in self._data:
+                self._bytes -= self._sizes.pop(key)
+                del self._data[key]
+            self._data[key] = value
+            self._sizes[key] = size
+            self._bytes += size
+            while self._data and self._over_budget():
+                old_key, old_value = self._data.popitem(last=False)
+                self._bytes -= self._sizes.pop(old_key)
+                self.evictions += 1
+                evicted.append((old_key, old_value))
+        for old_key, old_value in evicted:
+            if self.on_evict:
+                self.on_evict(old_key, old_value)
+        return True
+
+    def resize(self, key: Hashable, size: int) -> None:
+        """Update the recorded size of an entry that grew or shrank in place."""
+        evicted = []
+        with self._lock:
+            if key not in self._data:
+                return
+            self._bytes += size - self._sizes[key]
+            self._sizes[key] = size
+            # Never evict the entry being resized; callers trim it themselves
+            for old_key in list(self._data):
+                if not self._over_budget():
+                    break
+                if old_key == key:
+                    continue
+                old_value = self._data.pop(old_key)
+                self._bytes -= self._sizes.pop(old_key)
+                self.evictions += 1
+                evicted.append((old_key, old_value))
+        for old_key, old_value in evicted:
+            if self.on_evict:
+                self.on_evict(old_key, old_value)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove a value without calling on_evict."""
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._bytes -= self._sizes.pop(key)
+            return self._data.pop(key)
+
+    def clear(self) -> None:
+        """Remove every entry, calling on_evict for each."""
+        with self._lock:
+            items = list(self._data.items())
+            self._data.clear()
+            self._sizes.clear()
+            self._bytes = 0
+        for key, value in items:
+            if self.on_evict:
+                self.on_evict(key, value)
+
+    def _over_budget(self) -> bool:
+        if self.max_entries is not None and len(self._data) > self.max_entries:
+            return True
+        return self.max_bytes is not None and self._bytes > self.max_bytes
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def keys(self) -> List[Hashable]:
+        """Snapshot of the keys, least recently used first."""
+        with self._lock:
+            return list(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._bytes
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,150 @@
+# app/utils/encoding.py
+import base64
+import io
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from app.config import settings
+from app.utils.image_utils import index_labels, labels_to_colored_image
+
+# "auto" picks one of the others by label count and RESULT_ENCODING_TARGET
+RESULT_FORMATS = ("auto", "palette_png", "png", "webp", "labels")
+ENCODING_TARGETS = ("latency", "size")
+
+_EXTENSIONS = {"palette_png": ".png", "png": ".png", "webp": ".webp", "labels": ".npy"}
+_MEDIA_TYPES = {"palette_png": "image/png", "png": "image/png", "webp": "image/webp", "labels": "application/octet-stream"}
+
+
+@dataclass
+class EncodedImage:
+    """An encoded result image and what it cost to produce."""
+    data: bytes
+    format: str
+    encode_time: float  # seconds, including coloring the labels
+
+    @property
+    def extension(self) -> str:
+        return _EXTENSIONS[self.format]
+
+    @property
+    def media_type(self) -> str:
+        return _MEDIA_TYPES[self.format]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data)
+
+    def data_url(self) -> str:
+        """The image inline as a data: URL, for results that are never written to disk."""
+        return f"data:{self.media_type};base64,{base64.b64encode(self.data).decode('ascii')}"
+
+
+@lru_cache(maxsize=1)
+def webp_available() -> bool:
+    """Whether Pillow was built with WebP support."""
+    from PIL import features
+    return bool(features.check("webp"))
+
+
+def choose_format(num_colors: int, target: Optional[str] = None) -> str:
+    """Format for a label image with ``num_colors`` colors.
+
+    "latency": palette PNG while the colors fit a palette (one byte per pixel, no
+    RGB image at all), otherwise WebP's fastest lossless mode. "size": WebP's
+    default lossless effort, which beats PNG at every zlib level on label images.
+    PNG is the fallback when Pillow lacks WebP.
+    """
+    target = target or settings.RESULT_ENCODING_TARGET
+    if target not in ENCODING_TARGETS:
+        raise ValueError(f"Unknown encoding target: {target}")
+    if target == "latency" and num_colors <= 256:
+        return "palette_png"
+    if webp_available():
+        return "webp"
+    return "palette_png" if num_colors <= 256 else "png"
+
+
+def _webp_options(target: Optional[str]) -> dict:
+    # method 0 with quality 0 is the fastest lossless mode; method 4 is libwebp's default effort
+    if (target or settings.RESULT_ENCODING_TARGET) == "latency":
+        return {"method": 0, "quality": 0}
+    return {"method": 4, "quality": 100}
+
+
+def _save(image: Image.Image, format: str, target: Optional[str]) -> bytes:
+    buffer = io.BytesIO()
+    if format == "webp":
+        image.save(buffer, format="WEBP", lossless=True, **_webp_options(target))
+    else:
+        # No optimize=True: it re-runs zlib at level 9, for a few percent at several times the cost
+        image.save(buffer, format="PNG", compress_level=settings.RESULT_PNG_COMPRESS_LEVEL)
+    return buffer.getvalue()
+
+
+def encode_rgb_image(image: np.ndarray, format: Optional[str] = None, target: Optional[str] = None) -> EncodedImage:
+    """Encode an RGB (or grayscale) uint8 image as PNG or lossless WebP."""
+    start = time.perf_counter()
+    format = format or settings.RESULT_IMAGE_FORMAT
+    if format in ("auto", "palette_png"):
+        format = "webp" if webp_available() else "png"
+    if format not in ("png", "webp"):
+        raise ValueError(f"Cannot encode an RGB image as {format}")
+    if format == "webp" and not webp_available():
+        format = "png"
+    data = _save(Image.fromarray(image), format, target)
+    return EncodedImage(data=data, format=format, encode_time=time.perf_counter() - start)
+
+
+def encode_label_image(
+    labels: np.ndarray,
+    scheme: Optional[str] = None,
+    format: Optional[str] = None,
+    target: Optional[str] = None
+) -> EncodedImage:
+    """Color and encode a label map in one step.
+
+    ``scheme`` None renders like labels_to_colored_image (including its grayscale
+    single-segment case); a scheme name renders like colorize_labels. "labels"
+    stores the raw label map as .npy in the smallest unsigned dtype instead.
+    """
+    from app.ml.label_store import label_dtype
+
+    start = time.perf_counter()
+    format = format or settings.RESULT_IMAGE_FORMAT
+    if format not in RESULT_FORMATS:
+        raise ValueError(f"Unknown result image format: {format}")
+
+    if format == "labels":
+        buffer = io.BytesIO()
+        max_label = int(labels.max()) if labels.size else 0
+        np.lib.format.write_array(buffer, labels.astype(label_dtype(max_label), copy=False), allow_pickle=False)
+        return EncodedImage(data=buffer.getvalue(), format=format, encode_time=time.perf_counter() - start)
+
+    if scheme is None and (labels.size == 0 or labels.min() == labels.max()):
+        # Single segment: stays grayscale, as labels_to_colored_image renders it
+        image = Image.fromarray(labels_to_colored_image(labels))
+        if format in ("auto", "palette_png") or not webp_available():
+            format = "png"
+    else:
+        index, palette = index_labels(labels, scheme or "default")
+        num_colors = len(palette)
+        if format == "auto":
+            format = choose_format(num_colors, target)
+        if format == "palette_png" and num_colors > 256:
+            format = "png"
+        if format == "webp" and not webp_available():
+            format = "palette_png" if num_colors <= 256 else "png"
+        if format == "palette_png":
+            height, width = index.shape
+            image = Image.frombuffer("P", (width, height), np.ascontiguousarray(index), "raw", "P", 0, 1)
+            image.putpalette(palette.tobytes())
+        else:
+            image = Image.fromarray(np.take(palette, index, axis=0))
+
+    data = _save(image, format, target)
+    return EncodedImage(data=data, format=format, encode_time=time.perf_counter() - start)
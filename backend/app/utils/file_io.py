@@ -0,0 +1,73 @@
+# app/utils/file_io.py
+import asyncio
+import functools
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Callable, Iterator, Optional, TypeVar
+
+from app.config import settings
+
+T = TypeVar("T")
+
+# Blocking file I/O and image decode/encode, kept off the event loop and off the default executor
+_io_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    """Get (creating lazily) the bounded thread pool for file I/O."""
+    global _io_executor
+    if _io_executor is None:
+        _io_executor = ThreadPoolExecutor(max_workers=settings.IO_THREADS, thread_name_prefix="file-io")
+    return _io_executor
+
+
+async def run_io(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking call on the I/O pool.
+
+    The pool is bounded, so a burst of uploads queues here instead of starving the
+    loop or the default executor used for everything else.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_io_executor(), functools.partial(func, *args, **kwargs))
+
+
+@contextmanager
+def open_atomic(path: str) -> Iterator[BinaryIO]:
+    """Open a binary file for writing that only appears at ``path`` once complete.
+
+    Each writer gets its own temporary file next to ``path``, so concurrent writers
+    of the same path never interleave; the last rename wins. On error the
+    temporary file is removed and ``path`` is left as it was.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+        # mkstemp creates the file private to us; uploads are served to others
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        _discard(tmp_path)
+        raise
+
+
+def write_file_atomic(path: str, data: bytes) -> None:
+    """Write a file so readers never observe it partially written."""
+    with open_atomic(path) as f:
+        f.write(data)
+
+
+def _discard(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def shutdown_io_executor() -> None:
+    global _io_executor
+    if _io_executor is not None:
+        _io_executor.shutdown(wait=True)
+        _io_executor = None
@@ -1,16 +1,20 @@
 # app/utils/image_utils.py
+import hashlib
 import numpy as np
 from PIL import Image
 import io
+from functools import lru_cache
 from typing import Optional, Tuple
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
-from skimage.segmentation import mark_boundaries
-from skimage.color import label2rgb
 import structlog
 
+from app.config import settings
+from app.ml.metrics import segment_sizes, summarize_segment_sizes
+
 logger = structlog.get_logger()
 
+# Pillow refuses images above ~179M pixels as decompression bombs; allow anything we would keep
+Image.MAX_IMAGE_PIXELS = max(Image.MAX_IMAGE_PIXELS or 0, 2 * settings.MAX_IMAGE_DIMENSION ** 2)
+
 def validate_image(file_content: bytes) -> Optional[Image.Image]:
     """Validate and load image from bytes."""
     try:
@@ -48,35 +52,84 @@ def resize_image(image: Image.Image, max_dimension: int) -> Image.Image:
     
     return image.resize((new_width, new_height), Image.Resampling.LANCZOS)
 
+def content_hash(pixels: np.ndarray) -> str:
+    """BLAKE2b digest of an image's pixels and shape (the same for any file format holding them)."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{pixels.shape}:{pixels.dtype.str}".encode())
+    digest.update(np.ascontiguousarray(pixels).data)
+    return digest.hexdigest()
+
+COLOR_SCHEMES = ("default", "rainbow", "viridis", "plasma", "cool")
+
+@lru_cache(maxsize=256)
+def get_palette(scheme: str, num_labels: int) -> np.ndarray:
+    """uint8 (num_labels, 3) palette for a color scheme, cached per (scheme, count)."""
+    # matplotlib is only needed to build palettes; importing pyplot at startup is slow
+    from matplotlib import colormaps
+    
+    if scheme == "rainbow":
+        colors = colormaps["rainbow"](np.linspace(0, 1, num_labels))
+    elif scheme == "viridis":
+        colors = colormaps["viridis"](np.linspace(0, 1, num_labels))
+    elif scheme == "plasma":
+        colors = colormaps["plasma"](np.linspace(0, 1, num_labels))
+    elif scheme == "cool":
+        colors = colormaps["cool"](np.linspace(0, 1, num_labels))
+    else:  # default
+        colors = colormaps["tab20"](np.linspace(0, 1, min(num_labels, 20)))
+        if num_labels > 20:
+            additional_colors = colormaps["Set3"](np.linspace(0, 1, num_labels - 20))
+            colors = np.vstack([colors, additional_colors])
+    
+    palette = (colors[:, :3] * 255).astype(np.uint8)
+    palette.flags.writeable = False
+    return palette
+
+def _present_labels(labels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Labels shifted to start at 0 (flat), and which values between min and max occur."""
+    flat = labels.ravel()
+    offset = int(flat.min())
+    if offset:
+        flat = flat - offset
+    return flat, np.bincount(flat) > 0
+
+def colorize_labels(labels: np.ndarray, scheme: str = "default") -> np.ndarray:
+    """Color a label map with one lookup-table pass.
+    
+    The i-th smallest label gets palette color i, as with the previous per-label masks.
+    """
+    if labels.size == 0:
+        return np.zeros((*labels.shape, 3), dtype=np.uint8)
+    flat, present = _present_labels(labels)
+    num_labels = int(np.count_nonzero(present))
+    
+    # Label value -> color, for every value between min and max label
+    lookup = np.zeros((len(present), 3), dtype=np.uint8)
+    lookup[present] = get_palette(scheme, num_labels)
+    return np.take(lookup, flat, axis=0).reshape(*labels.shape, 3)
+
+def index_labels(labels: np.ndarray, scheme: str = "default") -> Tuple[np.ndarray, np.ndarray]:
+    """Palette image of a label map: (palette index per pixel, palette).
+    
+    Same colors as colorize_labels, without building the RGB image. Indices are
+    uint8 when there are at most 256 labels.
+    """
+    if labels.size == 0:
+        return np.zeros(labels.shape, dtype=np.uint8), get_palette(scheme, 0)
+    flat, present = _present_labels(labels)
+    num_labels = int(np.count_nonzero(present))
+    rank = np.cumsum(present) - 1
+    rank = rank.astype(np.uint8 if num_labels <= 256 else np.uint32)
+    return np.take(rank, flat).reshape(labels.shape), get_palette(scheme, num_labels)
+
 def labels_to_colored_image(labels: np.ndarray, alpha: float = 0.7) -> np.ndarray:
     """Convert segmentation labels to colored image."""
     try:
-        # Generate colors for labels
-        unique_labels = np.unique(labels)
-        num_labels = len(unique_labels)
-        
-        if num_labels <= 1:
+        if labels.size == 0 or labels.min() == labels.max():
             # Single segment, return grayscale
             return np.stack([labels] * 3, axis=-1).astype(np.uint8)
         
-        # Create colormap
-        colors = plt.cm.tab20(np.linspace(0, 1, min(num_labels, 20)))
-        if num_labels > 20:
-            # Generate additional colors
-            additional_colors = plt.cm.Set3(np.linspace(0, 1, num_labels - 20))
-            colors = np.vstack([colors, additional_colors])
-        
-        # Map labels to colors
-        colored_image = np.zeros((*labels.shape, 3))
-        
-        for i, label_id in enumerate(unique_labels):
-            mask = labels == label_id
-            colored_image[mask] = colors[i][:3]  # RGB only
-        
-        # Convert to uint8
-        colored_image = (colored_image * 255).astype(np.uint8)
-        
-        return colored_image
+        return colorize_labels(labels)
         
     except Exception as e:
         logger.error("Failed to convert labels to colored image", error=str(e))
@@ -86,6 +139,8 @@ def labels_to_colored_image(labels: np.ndarray, alpha: float = 0.7) -> np.ndarra
 
 def overlay_segments(image: np.ndarray, labels: np.ndarray, alpha: float = 0.5) -> np.ndarray:
     """Overlay segmentation boundaries on original image."""
+    from skimage.segmentation import mark_boundaries
+    
     try:
         # Ensure image is in the right format
         if image.dtype != np.uint8:
@@ -151,25 +206,7 @@ def create_comparison_grid(
 def get_segmentation_stats(labels: np.ndarray) -> dict:
     """Calculate segmentation statistics."""
     try:
-        unique_labels = np.unique(labels)
-        num_segments = len(unique_labels)
-        
-        # Calculate segment sizes
-        segment_sizes = []
-        for label_id in unique_labels:
-            size = np.sum(labels == label_id)
-            segment_sizes.append(size)
-        
-        stats = {
-            "num_segments": num_segments,
-            "min_segment_size": min(segment_sizes) if segment_sizes else 0,
-            "max_segment_size": max(segment_sizes) if segment_sizes else 0,
-            "mean_segment_size": np.mean(segment_sizes) if segment_sizes else 0,
-            "std_segment_size": np.std(segment_sizes) if segment_sizes else 0,
-            "total_pixels": labels.size
-        }
-        
-        return stats
+        return summarize_segment_sizes(segment_sizes(labels), int(labels.size))
         
     except Exception as e:
         logger.error("Failed to calculate segmentation stats", error=str(e))
@@ -192,31 +229,7 @@ def denormalize_image(image: np.ndarray) -> np.ndarray:
 def apply_color_scheme(labels: np.ndarray, scheme: str = "default") -> np.ndarray:
     """Apply different color schemes to segmentation labels."""
     try:
-        unique_labels = np.unique(labels)
-        num_labels = len(unique_labels)
-        
-        if scheme == "rainbow":
-            colors = plt.cm.rainbow(np.linspace(0, 1, num_labels))
-        elif scheme == "viridis":
-            colors = plt.cm.viridis(np.linspace(0, 1, num_labels))
-        elif scheme == "plasma":
-            colors = plt.cm.plasma(np.linspace(0, 1, num_labels))
-        elif scheme == "cool":
-            colors = plt.cm.cool(np.linspace(0, 1, num_labels))
-        else:  # default
-            colors = plt.cm.tab20(np.linspace(0, 1, min(num_labels, 20)))
-            if num_labels > 20:
-                additional_colors = plt.cm.Set3(np.linspace(0, 1, num_labels - 20))
-                colors = np.vstack([colors, additional_colors])
-        
-        # Map labels to colors
-        colored_image = np.zeros((*labels.shape, 3))
-        
-        for i, label_id in enumerate(unique_labels):
-            mask = labels == label_id
-            colored_image[mask] = colors[i][:3]
-        
-        return (colored_image * 255).astype(np.uint8)
+        return colorize_labels(labels, scheme)
         
     except Exception as e:
         logger.error("Failed to apply color scheme", scheme=scheme, error=str(e))
@@ -0,0 +1,188 @@
+# app/utils/performance.py
+import importlib
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass
+from types import ModuleType
+from typing import Any, Dict, Iterator, Optional
+
+import psutil
+
+from app.config import settings
+
+# Time spent on the first import of each lazily imported module, and on each startup phase
+_import_timings: Dict[str, float] = {}
+_startup_timings: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def record_import_time(module_name: str, seconds: float) -> None:
+    with _lock:
+        _import_timings.setdefault(module_name, seconds)
+
+
+def lazy_import(module_name: str) -> ModuleType:
+    """Import a module on first use, recording how long that first import took."""
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    record_import_time(module_name, time.perf_counter() - start)
+    return module
+
+
+@contextmanager
+def startup_phase(name: str) -> Iterator[None]:
+    """Time one step of application startup."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _startup_timings[name] = time.perf_counter() - start
+
+
+def get_startup_report() -> Dict[str, Any]:
+    """Startup phase and lazy import timings (in ms) of the current process."""
+    with _lock:
+        phases = dict(_startup_timings)
+        imports = dict(_import_timings)
+    process_age = time.time() - psutil.Process(os.getpid()).create_time()
+    return {
+        "pid": os.getpid(),
+        "process_age_s": round(process_age, 3),
+        "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in phases.items()},
+        "imports_ms": {
+            name: round(seconds * 1000, 1)
+            for name, seconds in sorted(imports.items(), key=lambda item: item[1], reverse=True)
+        }
+    }
+
+
+MB = 1024 * 1024
+
+MEMORY_PROFILERS = ("tracemalloc", "rss", "off")
+
+# Set in segmentation worker processes, which run one job at a time; memory is
+# measured process-wide, so stages are only recorded there
+_single_job_process = False
+
+
+def mark_single_job_process() -> None:
+    global _single_job_process
+    _single_job_process = True
+
+
+@dataclass
+class StageMemory:
+    """Memory of one pipeline stage, in MB relative to what was allocated when it started."""
+    peak: float  # highest allocation during the stage
+    net: float  # still allocated when the stage ended (negative if it freed memory)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"peak": round(self.peak, 3), "net": round(self.net, 3)}
+
+
+class _RSSSampler:
+    """Polls the process RSS from a background thread and keeps the maximum."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._process = psutil.Process(os.getpid())
+        self.start = self.peak = self._process.memory_info().rss
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._process.memory_info().rss)
+
+    def stop(self) -> int:
+        self._stop.set()
+        self._thread.join()
+        end = self._process.memory_info().rss
+        self.peak = max(self.peak, end)
+        return end
+
+
+class MemoryProfiler:
+    """Peak and net memory per pipeline stage of one job.
+
+    "tracemalloc" counts every Python allocation, including NumPy array buffers
+    (NumPy reports them to tracemalloc); memory allocated directly by C extensions
+    is missed. "rss" samples the resident set size every MEMORY_SAMPLE_INTERVAL
+    seconds instead, which sees everything but also the allocator's caching.
+    Either way the whole process is measured, so concurrent jobs would count each
+    other's memory: stages are only recorded in processes marked with
+    mark_single_job_process() (the process executor's workers) and are skipped
+    elsewhere (thread and inline executors, the API process) unless ``mode`` is
+    given explicitly. Tracing is only switched on for the duration of a stage.
+    """
+
+    def __init__(self, mode: Optional[str] = None):
+        self.mode = mode or settings.MEMORY_PROFILER
+        if self.mode not in MEMORY_PROFILERS:
+            raise ValueError(f"Unknown memory profiler: {self.mode}")
+        if mode is None and not _single_job_process:
+            self.mode = "off"
+        self.stages: Dict[str, StageMemory] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Measure the memory of the enclosed block as stage ``name``."""
+        if self.mode == "tracemalloc":
+            # Tracing slows every allocation, so it only runs while a stage is open
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start()
+            start, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            try:
+                yield
+            finally:
+                current, peak = tracemalloc.get_traced_memory()
+                if started:
+                    tracemalloc.stop()
+                self.stages[name] = StageMemory(peak=(peak - start) / MB, net=(current - start) / MB)
+        elif self.mode == "rss":
+            sampler = _RSSSampler(settings.MEMORY_SAMPLE_INTERVAL)
+            try:
+                yield
+            finally:
+                end = sampler.stop()
+                self.stages[name] = StageMemory(
+                    peak=(sampler.peak - sampler.start) / MB, net=(end - sampler.start) / MB
+                )
+        else:
+            yield
+
+    def merge(self, stages: Optional[Dict[str, StageMemory]]) -> None:
+        """Add stages measured elsewhere (e.g. in a worker process).
+
+        A stage measured more than once (e.g. once per tile) keeps the highest
+        peak and the total net.
+        """
+        for name, stage in (stages or {}).items():
+            known = self.stages.get(name)
+            if known is not None:
+                stage = StageMemory(peak=max(known.peak, stage.peak), net=known.net + stage.net)
+            self.stages[name] = stage
+
+    @property
+    def peak(self) -> Optional[float]:
+        """Largest stage peak, in MB."""
+        return max((stage.peak for stage in self.stages.values()), default=None)
+
+    @property
+    def net(self) -> Optional[float]:
+        """Memory the stages left allocated in total, in MB."""
+        return sum(stage.net for stage in self.stages.values()) if self.stages else None
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        return {name: stage.to_dict() for name, stage in self.stages.items()}
@@ -0,0 +1,65 @@
+# app/utils/validators.py
+import math
+from decimal import Decimal
+from typing import Any, Dict
+
+
+def _decimals(step: float) -> int:
+    """Decimal places of a step, e.g. 0.1 -> 1, 10 -> 0."""
+    return max(0, -Decimal(str(step)).normalize().as_tuple().exponent)
+
+
+def canonicalize_parameters(
+    parameters: Dict[str, Any],
+    defaults: Dict[str, Any],
+    ranges: Dict[str, Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Canonical form of algorithm parameters: equal settings give equal dicts.
+
+    Defaults are merged in and parameters neither has are dropped. Numbers are
+    coerced to the range's "type", clamped to "min"/"max" and snapped to the
+    "step" grid starting at "min" (rounded to the step's decimals, so slider noise
+    like 0.30000000000000004 disappears). "string" parameters must be one of
+    "options". Raises ValueError for values that cannot be coerced.
+    """
+    merged = {**defaults, **parameters}
+    canonical = {}
+    for name in sorted(merged):
+        if name not in defaults and name not in ranges:
+            continue
+        value = merged[name]
+        spec = ranges.get(name)
+        if spec is None:
+            canonical[name] = value
+            continue
+
+        kind = spec.get("type", "float")
+        if kind == "string":
+            options = spec.get("options")
+            if options is not None and value not in options:
+                raise ValueError(f"Invalid value for {name}: {value!r} (expected one of {list(options)})")
+            canonical[name] = value
+            continue
+
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid value for {name}: {value!r}")
+        if not math.isfinite(number):
+            raise ValueError(f"Invalid value for {name}: {value!r}")
+
+        low, high, step = spec.get("min"), spec.get("max"), spec.get("step")
+        if low is not None:
+            number = max(number, float(low))
+        if high is not None:
+            number = min(number, float(high))
+        if step:
+            origin = float(low) if low is not None else 0.0
+            number = origin + round((number - origin) / float(step)) * float(step)
+            # Snapping up to the next step must not leave the range
+            if high is not None and number > float(high):
+                number -= float(step)
+            number = round(number, _decimals(step))
+
+        canonical[name] = int(round(number)) if kind == "int" else float(number)
+    return canonical
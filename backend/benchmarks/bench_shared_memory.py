@@ -0,0 +1,102 @@
+# benchmarks/bench_shared_memory.py
+"""Bytes copied per segmentation request with and without the shared image store.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_shared_memory --size 2048 --algorithms 4
+"""
+import argparse
+import multiprocessing
+import os
+import pickle
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.ml.shared_memory import (
+    SharedArrayHandle, SharedImageStore, attach_shared_array, take_shared_array, write_shared_array
+)
+
+
+def _labels_job(image, result_path=None):
+    """Stand-in for run_segmentation: same transfer pattern, no segmentation cost."""
+    if isinstance(image, SharedArrayHandle):
+        image = attach_shared_array(image)
+    labels = (image[..., 0] // 16).astype(np.int32)
+    if result_path is not None:
+        return write_shared_array(labels, result_path)
+    return labels
+
+
+def bytes_pickled(image: np.ndarray, algorithms: int) -> int:
+    """Pickled bytes when the image goes to and the labels come back from each worker."""
+    labels = _labels_job(image)
+    per_job = len(pickle.dumps(image, protocol=pickle.HIGHEST_PROTOCOL))
+    per_job += len(pickle.dumps(labels, protocol=pickle.HIGHEST_PROTOCOL))
+    return per_job * algorithms
+
+
+def bytes_shared(image: np.ndarray, algorithms: int, store: SharedImageStore, first_request: bool) -> int:
+    """Bytes copied with the store: one image write per image plus one labels write per job."""
+    handle = store.acquire("bench", image)
+    try:
+        copied = image.nbytes if first_request else 0
+        labels_nbytes = image.shape[0] * image.shape[1] * np.dtype(np.int32).itemsize
+        for _ in range(algorithms):
+            copied += len(pickle.dumps(handle, protocol=pickle.HIGHEST_PROTOCOL))
+            copied += labels_nbytes
+        return copied
+    finally:
+        store.release("bench")
+
+
+def time_requests(pool, image, algorithms, repeats, store=None):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        if store is None:
+            futures = [pool.submit(_labels_job, image) for _ in range(algorithms)]
+            [future.result() for future in futures]
+        else:
+            handle = store.acquire("bench", image)
+            try:
+                futures = [pool.submit(_labels_job, handle, store.new_result_path()) for _ in range(algorithms)]
+                [take_shared_array(future.result()) for future in futures]
+            finally:
+                store.release("bench")
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--algorithms", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, size=(args.size, args.size, 3), dtype=np.uint8)
+    base_path = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    store = SharedImageStore(base_path=os.path.join(base_path, "segmentation-bench"), max_bytes=1 << 30)
+
+    mb = 1024 * 1024
+    print(f"image {image.shape} = {image.nbytes / mb:.1f} MB, {args.algorithms} algorithms per request")
+    print(f"pickled:                {bytes_pickled(image, args.algorithms) / mb:8.1f} MB copied per request")
+    print(f"shared (first request): {bytes_shared(image, args.algorithms, store, True) / mb:8.1f} MB copied per request")
+    print(f"shared (same image):    {bytes_shared(image, args.algorithms, store, False) / mb:8.1f} MB copied per request")
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.algorithms, mp_context=context) as pool:
+        time_requests(pool, image, args.algorithms, 1)
+        pickled_time = time_requests(pool, image, args.algorithms, args.repeats)
+        shared_time = time_requests(pool, image, args.algorithms, args.repeats, store)
+    print(f"transfer time (best of {args.repeats}): pickled {pickled_time * 1000:.1f} ms, "
+          f"shared {shared_time * 1000:.1f} ms")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
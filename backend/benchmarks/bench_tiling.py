@@ -0,0 +1,93 @@
+# benchmarks/bench_tiling.py
+"""Time and peak memory of tiled segmentation on a large synthetic image.
+
+The image is the astronaut sample tiled into a --size x --size mosaic. Peak memory
+is the largest combined RSS of the API process and its segmentation workers,
+sampled every 50ms.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_tiling --size 10000 --algorithm slic --workers 4
+"""
+import argparse
+import asyncio
+import threading
+import time
+
+import numpy as np
+import psutil
+from skimage import data
+from skimage.transform import resize
+
+from app.config import settings
+from app.ml.executors import get_executor
+from app.ml.tiling import run_tiled
+
+
+class PeakRSS:
+    """Background sampler of this process tree's resident memory."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        process = psutil.Process()
+        while not self._stop.is_set():
+            rss = process.memory_info().rss
+            for child in process.children(recursive=True):
+                try:
+                    rss += child.memory_info().rss
+                except psutil.NoSuchProcess:
+                    pass
+            self.peak = max(self.peak, rss)
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def mosaic(size: int) -> np.ndarray:
+    tile = (resize(data.astronaut(), (1250, 1250), anti_aliasing=True) * 255).astype(np.uint8)
+    repeats = -(-size // tile.shape[0])
+    return np.ascontiguousarray(np.tile(tile, (repeats, repeats, 1))[:size, :size])
+
+
+async def run(args) -> None:
+    settings.SEGMENTATION_WORKERS = args.workers
+    settings.TILE_SIZE = args.tile_size
+    image = mosaic(args.size)
+    executor = get_executor("process")
+    executor.start()
+    parameters = {"n_segments": args.segments} if args.algorithm == "slic" else {}
+    try:
+        with PeakRSS() as sampler:
+            start = time.perf_counter()
+            labels, metrics = await run_tiled(executor, args.algorithm, image, parameters, image_key="bench")
+            elapsed = time.perf_counter() - start
+    finally:
+        executor.shutdown()
+    print(f"image {image.shape} ({image.nbytes / 2**20:.0f}MB), labels {labels.nbytes / 2**20:.0f}MB")
+    print(f"{args.algorithm}: {metrics.segments_count} segments in {elapsed:.1f}s, "
+          f"peak RSS {sampler.peak / 2**20:.0f}MB with {args.workers} workers")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--algorithm", default="slic")
+    parser.add_argument("--segments", type=int, default=20000, help="SLIC n_segments")
+    parser.add_argument("--tile-size", type=int, default=settings.TILE_SIZE)
+    parser.add_argument("--workers", type=int, default=4)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
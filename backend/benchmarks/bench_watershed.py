@@ -0,0 +1,66 @@
+# benchmarks/bench_watershed.py
+"""Watershed time per marker strategy, cold and on slider updates.
+
+"cold" is the first request for an image (elevation and seed ranking included);
+"markers" and "compactness" are follow-up requests for the same image that only
+change those sliders and therefore only re-flood.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_watershed --size 1024
+"""
+import argparse
+import time
+
+import numpy as np
+from skimage import data
+from skimage.transform import resize
+
+from app.ml.algorithms.watershed import MARKER_STRATEGIES, WatershedAlgorithm
+from app.ml.metrics import count_segments
+from app.ml.preprocessing import ImageFeatures
+
+
+def best_time(run, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--markers", type=int, default=250)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    image = (resize(data.astronaut(), (args.size, args.size), anti_aliasing=True) * 255).astype(np.uint8)
+    algorithm = WatershedAlgorithm()
+    base = {**algorithm.get_default_parameters(), "markers": args.markers}
+
+    print(f"image {image.shape}, {args.markers} markers, best of {args.repeats}")
+    print(f"{'strategy':<20}{'cold':>10}{'markers':>10}{'compactness':>13}{'segments':>10}")
+    for strategy in MARKER_STRATEGIES:
+        parameters = {**base, "marker_strategy": strategy}
+
+        cold = best_time(lambda: algorithm.segment(image, parameters, features=ImageFeatures(image)), args.repeats)
+
+        features = ImageFeatures(image)
+        labels, _ = algorithm.segment(image, parameters, features=features)
+        markers_update = best_time(
+            lambda: algorithm.segment(image, {**parameters, "markers": args.markers + 50}, features=features),
+            args.repeats
+        )
+        compactness_update = best_time(
+            lambda: algorithm.segment(image, {**parameters, "compactness": 0.5}, features=features),
+            args.repeats
+        )
+        print(f"{strategy:<20}{cold * 1000:>8.0f}ms{markers_update * 1000:>8.0f}ms"
+              f"{compactness_update * 1000:>11.0f}ms{count_segments(labels):>10}")
+
+
+if __name__ == "__main__":
+    main()
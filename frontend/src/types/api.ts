@@ -35,6 +35,7 @@ export interface ParameterSchema {
   min_value?: number;
   max_value?: number;
   step?: number;
+  options?: string[];
   type: 'int' | 'float' | 'string' | 'bool';
 }
 
@@ -45,21 +46,44 @@ export interface AlgorithmConfig {
   is_active: boolean;
 }
 
+export interface StageMemoryUsage {
+  peak: number; // MB
+  net: number; // MB
+}
+
 export interface PerformanceMetrics {
   processing_time: number;
-  memory_usage?: number;
+  memory_usage?: number; // peak MB over all stages
+  memory_net?: number;
+  memory_stages?: Record<string, StageMemoryUsage>;
   segments_count: number;
   algorithm_name: string;
   image_dimensions: [number, number];
+  image_format?: string; // palette_png | png | webp
+  encode_time?: number; // seconds
+  encoded_bytes?: number;
+}
+
+export interface SegmentStatistics {
+  num_segments: number;
+  min_segment_size: number;
+  max_segment_size: number;
+  mean_segment_size: number;
+  std_segment_size: number;
+  total_pixels: number;
 }
 
 export interface SegmentationResult {
   algorithm_name: AlgorithmType;
   result_image_url: string;
+  result_id?: string; // key of the stored label map
+  labels_url?: string;
   segments_count: number;
   processing_time: number;
   parameters_used: Record<string, any>;
   metrics?: PerformanceMetrics;
+  segment_stats?: SegmentStatistics;
+  resolution_level?: number;
   created_at: string;
 }
 
@@ -5,6 +5,7 @@ export type WSMessageType =
   | 'parameter_update' 
   | 'segmentation_start' 
   | 'segmentation_progress' 
+  | 'segmentation_preview'
   | 'segmentation_complete' 
   | 'segmentation_error'
   | 'view_mode_change'
@@ -34,9 +35,18 @@ export interface WSSegmentationProgress extends WSMessage {
   estimated_time_remaining?: number;
 }
 
+export interface WSSegmentationPreview extends WSMessage {
+  type: 'segmentation_preview';
+  result: any; // SegmentationResult, computed on a downscaled image
+  resolution_level: number;
+  scale: number;
+  request_id?: string;
+}
+
 export interface WSSegmentationComplete extends WSMessage {
   type: 'segmentation_complete';
   result: any; // SegmentationResult
+  resolution_level?: number;
 }
 
 export interface WSSegmentationError extends WSMessage {